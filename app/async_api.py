@@ -0,0 +1,388 @@
+import asyncio
+import contextlib
+import logging
+import os
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy import select, exists, or_, and_
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from werkzeug.http import quote_etag, parse_etags, http_date, parse_date
+from .database import database_uri, async_database_uri, engine_options, tune_engine
+from .models import User, Project, Expense, ProjectParticipant, SchemaVersion
+from .money import to_cents, valid_amount
+from .routes import EXPENSE_PAGE_DEFAULT, EXPENSE_PAGE_MAX, API_WRITE_HEADER
+from .schema import SCHEMA_VERSION
+from . import ledger, queries
+
+logger = logging.getLogger(__name__)
+
+# Requests allowed to queue for a database slot before new ones are turned away
+DEFAULT_MAX_WAITING = 1000
+# Seconds a request may queue for a database slot before it is answered 503
+DEFAULT_QUEUE_TIMEOUT = 5.0
+# Default slots on SQLite: each aiosqlite connection is a thread, and past a
+# couple of them they only contend with the event loop for the GIL
+DEFAULT_SQLITE_CONCURRENCY = 2
+
+# Async tier of the JSON API for high-concurrency clients, served over ASGI
+# (e.g. `uvicorn asgi:app`) next to the Flask app. It mirrors the project list
+# and expense endpoints on an async engine with its own pool, reusing the
+# models, the Core statements of app.queries and, through run_sync, the write
+# path of app.ledger. Clients authenticate with the Flask session cookie.
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request can't get a database slot within the backpressure limits.
+    """
+
+
+class APIError(Exception):
+    """
+    Error answered to the client as a JSON {'error': message} with the given status.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Backpressure:
+    """
+    Bounds the requests that work on the database at the same time.
+
+    At most `limit` requests hold a slot; by default that is the number of
+    pooled connections, so nobody waits inside the pool. Up to `max_waiting`
+    more queue for at most `timeout` seconds. Beyond that requests are
+    rejected right away, which keeps latency and memory bounded under
+    overload instead of letting the queue grow without limit.
+
+    Attributes:
+        limit (int): Requests holding a slot at most.
+        max_waiting (int): Requests queued for a slot at most.
+        timeout (float): Seconds a request may queue.
+        active (int): Requests holding a slot.
+        waiting (int): Requests queued for a slot.
+        rejected (int): Requests turned away since start.
+    """
+
+    def __init__(self, limit, max_waiting=DEFAULT_MAX_WAITING, timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(limit)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise Overloaded()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting,
+                'max_waiting': self.max_waiting, 'rejected': self.rejected}
+
+
+def create_async_app(config=None):
+    """
+    Create the ASGI application of the async JSON API.
+
+    The database is the one of the Flask app (DB_PROFILE / DATABASE_URL),
+    reached through the async driver of its backend unless
+    ASYNC_DATABASE_URL names another URI. The async engine keeps its own
+    pool, sized like the sync one and tunable with ASYNC_POOL_SIZE,
+    ASYNC_MAX_OVERFLOW and ASYNC_POOL_TIMEOUT. Backpressure is set by
+    ASYNC_MAX_CONCURRENCY (default: pool size plus overflow, or
+    DEFAULT_SQLITE_CONCURRENCY on SQLite), ASYNC_MAX_WAITING and
+    ASYNC_QUEUE_TIMEOUT.
+
+    The schema is not migrated here; until it is current every endpoint
+    answers 503, as in the Flask app's production boot mode.
+
+    Args:
+        config (dict): Optional settings applied on top of the environment-derived ones.
+    """
+    settings = {
+        'SECRET_KEY': os.getenv('SECRET_KEY'),
+        'SQLALCHEMY_DATABASE_URI': database_uri(),
+        'ASYNC_DATABASE_URI': os.getenv('ASYNC_DATABASE_URL'),
+        'ASYNC_POOL_SIZE': os.getenv('ASYNC_POOL_SIZE'),
+        'ASYNC_MAX_OVERFLOW': os.getenv('ASYNC_MAX_OVERFLOW'),
+        'ASYNC_POOL_TIMEOUT': os.getenv('ASYNC_POOL_TIMEOUT'),
+        'ASYNC_MAX_CONCURRENCY': os.getenv('ASYNC_MAX_CONCURRENCY'),
+        'ASYNC_MAX_WAITING': int(os.getenv('ASYNC_MAX_WAITING', DEFAULT_MAX_WAITING)),
+        'ASYNC_QUEUE_TIMEOUT': float(os.getenv('ASYNC_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)),
+    }
+    if config:
+        settings.update(config)
+
+    uri = settings['ASYNC_DATABASE_URI'] or async_database_uri(settings['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options(uri)
+    for key, name in (('pool_size', 'ASYNC_POOL_SIZE'), ('max_overflow', 'ASYNC_MAX_OVERFLOW'),
+                      ('pool_timeout', 'ASYNC_POOL_TIMEOUT')):
+        if settings[name] and key in options:
+            options[key] = int(settings[name])
+    engine = create_async_engine(uri, **options)
+    tune_engine(engine.sync_engine)
+
+    limit = settings['ASYNC_MAX_CONCURRENCY']
+    if not limit:
+        limit = options.get('pool_size', 1) + options.get('max_overflow', 0)
+        if engine.dialect.name == 'sqlite':
+            limit = min(limit, DEFAULT_SQLITE_CONCURRENCY)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with app.state.sessions() as session:
+            app.state.schema_current = await _schema_current(session)
+        if not app.state.schema_current:
+            logger.error('Database schema is not at version %s; run `flask schema migrate`', SCHEMA_VERSION)
+        yield
+        await engine.dispose()
+
+    app = Starlette(routes=[
+        Route('/api/projects', api_projects),
+        Route('/api/projects/{project_id:int}/expenses', api_project_expenses),
+        Route('/api/projects/{project_id:int}/expenses', api_create_expense, methods=['POST']),
+    ], lifespan=lifespan)
+    app.state.engine = engine
+    app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    app.state.backpressure = Backpressure(int(limit), settings['ASYNC_MAX_WAITING'], settings['ASYNC_QUEUE_TIMEOUT'])
+    # SQLite has a single writer; queueing writes here avoids its busy-wait sleeps
+    app.state.write_lock = asyncio.Lock() if engine.dialect.name == 'sqlite' else contextlib.nullcontext()
+    app.state.cookies = _session_cookies(settings['SECRET_KEY'])
+    app.state.schema_current = False
+    return app
+
+
+def _session_cookies(secret_key):
+    """
+    Return the serializer that signs the Flask app's session cookies, and their name and lifetime.
+    """
+    flask_app = Flask(__name__)
+    flask_app.secret_key = secret_key
+    serializer = SecureCookieSessionInterface().get_signing_serializer(flask_app)
+    return (serializer, flask_app.config['SESSION_COOKIE_NAME'],
+            int(flask_app.permanent_session_lifetime.total_seconds()))
+
+
+def _session_user_id(request):
+    """
+    Return the ID of the user logged in with Flask-Login, from the signed session cookie.
+    """
+    serializer, name, max_age = request.app.state.cookies
+    cookie = request.cookies.get(name)
+    if not cookie or serializer is None:
+        return None
+    try:
+        user_id = serializer.loads(cookie, max_age=max_age).get('_user_id')
+    except BadSignature:
+        return None
+    try:
+        return int(user_id) if user_id is not None else None
+    except ValueError:
+        return None
+
+
+async def _schema_current(session):
+    try:
+        version = (await session.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1))).scalar()
+    except (OperationalError, ProgrammingError):  # No schema_version table yet
+        return False
+    return version == SCHEMA_VERSION
+
+
+def endpoint(handler):
+    """
+    Wrap an API handler: authenticate, take a backpressure slot and open a session.
+
+    The handler is called as handler(request, session, user), where user is
+    the (id, username, version) row of the logged-in user. Writes must carry
+    API_WRITE_HEADER, as on the sync routes.
+    """
+    async def wrapper(request):
+        state = request.app.state
+        user_id = _session_user_id(request)
+        if user_id is None:
+            return _error(401, 'Authentication required.')
+        if request.method not in ('GET', 'HEAD') and not request.headers.get(API_WRITE_HEADER):
+            return _error(403, f'API writes must send the {API_WRITE_HEADER} header.')  # As the sync API, against forged forms
+        try:
+            async with state.backpressure.slot(), state.sessions() as session:
+                if not state.schema_current:
+                    state.schema_current = await _schema_current(session)
+                    if not state.schema_current:
+                        return _error(503, 'The database schema is out of date.')
+                user = (await session.execute(
+                    select(User.id, User.username, User.version).where(User.id == user_id)
+                )).one_or_none()
+                if user is None:
+                    return _error(401, 'Authentication required.')
+                return await handler(request, session, user)
+        except Overloaded:
+            return _error(503, 'The server is busy, please retry shortly.', {'Retry-After': '1'})
+        except APIError as e:
+            return _error(e.status, e.message)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+
+def _error(status, message, headers=None):
+    return JSONResponse({'error': message}, status_code=status, headers=headers)
+
+
+def _not_modified(request, etag, last_modified=None):
+    """
+    Check whether the client's cached copy is current, like werkzeug's is_resource_modified.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        return parse_etags(if_none_match).contains(etag)
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    return (if_modified_since is not None and last_modified is not None
+            and last_modified.replace(microsecond=0) <= if_modified_since.replace(tzinfo=None))
+
+
+def _with_validators(response, etag, last_modified=None):
+    """
+    Attach the validators to a response and make clients revalidate before reuse.
+    """
+    response.headers['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Payloads depend on the logged-in user's access
+    return response
+
+
+async def _load_project(session, project_id, user_id):
+    """
+    Return the (version, updated_at) row of a project the user may access.
+
+    Existence and membership are checked in one query; raises APIError 404
+    or 403 like the sync views.
+    """
+    is_member = or_(
+        Project.creator_id == user_id,
+        exists().where(and_(ProjectParticipant.project_id == Project.id, ProjectParticipant.user_id == user_id)),
+    )
+    row = (await session.execute(
+        select(Project.version, Project.updated_at, is_member).where(Project.id == project_id)
+    )).one_or_none()
+    if row is None:
+        raise APIError(404, 'Project not found.')
+    if not row[2]:
+        raise APIError(403, 'You do not have access to this project.')
+    return row
+
+
+@endpoint
+async def api_projects(request, session, user):
+    """
+    Returns a JSON list of projects the current user has access to.
+
+    Same payload and ETag as the sync /api/projects, including `stats=1`.
+    """
+    with_stats = request.query_params.get('stats') == '1'
+    etag = f'user-{user.id}-v{user.version}'
+    if _not_modified(request, etag):
+        return _with_validators(Response(status_code=304), etag)
+    rows = await session.execute(queries.user_projects_select(user.id, with_stats))
+    projects = [queries.to_project_row(row, with_stats).to_dict(with_stats) for row in rows]
+    return _with_validators(JSONResponse(projects), etag)
+
+
+@endpoint
+async def api_project_expenses(request, session, user):
+    """
+    Returns a page of the open expenses of a project, oldest first.
+
+    Same keyset pages (`limit`, `after`), payload and validators as the sync
+    endpoint. Streaming with `stream=1` is left to the sync tier.
+    """
+    project_id = request.path_params['project_id']
+    version, updated_at, _ = await _load_project(session, project_id, user.id)
+    etag = f'project-{project_id}-v{version}'
+    if _not_modified(request, etag, updated_at):
+        return _with_validators(Response(status_code=304), etag, updated_at)
+
+    after = request.query_params.get('after')
+    try:
+        cursor = queries.decode_cursor(after) if after else None
+    except ValueError:
+        raise APIError(400, 'Invalid cursor.')
+    try:
+        limit = min(int(request.query_params.get('limit', EXPENSE_PAGE_DEFAULT)), EXPENSE_PAGE_MAX)
+    except ValueError:
+        limit = EXPENSE_PAGE_DEFAULT
+    if limit < 1:
+        raise APIError(400, 'limit must be positive.')
+
+    stmt = queries.expense_select(Expense, Expense.project_id == project_id).order_by(Expense.created_at, Expense.id)
+    if cursor:
+        stmt = queries.after_cursor(stmt, Expense, *cursor)
+    rows = [queries.to_expense_row(row) for row in await session.execute(stmt.limit(limit + 1))]
+    page = rows[:limit]
+    next_cursor = queries.encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    payload = {'expenses': [expense.to_dict() for expense in page], 'next': next_cursor}
+    return _with_validators(JSONResponse(payload), etag, updated_at)
+
+
+@endpoint
+async def api_create_expense(request, session, user):
+    """
+    Adds an expense paid by the current user to a project.
+
+    Expects a JSON body with `description` and a non-zero `amount`, and
+    answers 201 with the expense as the listing shows it. The write runs
+    ledger.add_expense, the same transaction as the sync project page.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        raise APIError(400, 'Expected a JSON body.')
+    description = data.get('description') if isinstance(data, dict) else None
+    amount = data.get('amount') if isinstance(data, dict) else None
+    if not isinstance(description, str) or not description.strip():
+        raise APIError(400, 'description is required.')
+    max_length = Expense.__table__.c.description.type.length
+    if len(description) > max_length:
+        raise APIError(400, f'description is longer than {max_length} characters.')
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not valid_amount(amount):
+        raise APIError(400, 'amount must be a finite number within range.')
+    amount_cents = to_cents(amount)
+    if not amount_cents:
+        raise APIError(400, 'amount must be at least one cent.')
+
+    project_id = request.path_params['project_id']
+    await _load_project(session, project_id, user.id)
+    async with request.app.state.write_lock:
+        expense = await session.run_sync(
+            lambda sync_session: ledger.add_expense(project_id, user.id, description, amount_cents, session=sync_session)
+        )
+        await session.commit()
+    row = queries.ExpenseRow(expense.id, expense.description, amount_cents, user.username, expense.created_at)
+    return JSONResponse(row.to_dict(), status_code=201)
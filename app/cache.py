@@ -0,0 +1,288 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import update, select, or_
+from .models import db, User, Project, ProjectParticipant
+
+# Default budget for cached payloads, overridable with CACHE_MAX_BYTES
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Least recently used entries read per round when the SQLite cache evicts
+EVICT_BATCH = 100
+
+
+class CacheStats:
+    """
+    Hit/miss/eviction counters of a cache backend (per process).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class NullBackend:
+    """
+    Backend that never stores anything; used to disable caching.
+    """
+
+    name = 'null'
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.misses += 1
+        return None
+
+    def set(self, key, data):
+        pass
+
+    def usage(self):
+        return {'entries': 0, 'bytes': 0, 'max_bytes': 0}
+
+
+class LRUBackend:
+    """
+    In-process LRU cache bounded by the total size of the stored payloads.
+
+    Values are kept pickled, which both gives an exact size for eviction and
+    stops callers from mutating cached objects.
+    """
+
+    name = 'lru'
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return data
+
+    def set(self, key, data):
+        size = len(key) + len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(key) + len(old)
+            self._entries[key] = data
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, old_data = self._entries.popitem(last=False)
+                self._bytes -= len(old_key) + len(old_data)
+                self.stats.evictions += 1
+
+    def usage(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+class SQLiteBackend:
+    """
+    Cache stored in a local SQLite file, shared by every worker process on the host.
+
+    Entries are evicted least-recently-used once the stored payloads exceed
+    max_bytes. The total size is kept in a one-row cache_size table updated
+    with each write, so a set costs O(log n) plus the evicted entries, which
+    are taken from the accessed index. Each thread keeps its own connection.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL)')
+            # Cache files from before the running total are summed once
+            conn.execute('INSERT OR IGNORE INTO cache_size (id, total) SELECT 1, COALESCE(SUM(size), 0) FROM cache')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (time.time(), key))
+        self.stats.hits += 1
+        return row[0]
+
+    def set(self, key, data):
+        size = len(key) + len(data)
+        if size > self.max_bytes:
+            return
+        conn = self._connection()
+        evicted = 0
+        conn.execute('BEGIN IMMEDIATE')  # Keeps the running total consistent across processes
+        try:
+            old = conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                         (key, data, size, time.time()))
+            conn.execute('UPDATE cache_size SET total = total + ? WHERE id = 1', (size - (old[0] if old else 0),))
+            total = conn.execute('SELECT total FROM cache_size WHERE id = 1').fetchone()[0]
+            # Drop the least recently used entries until the budget fits again.
+            while total > self.max_bytes:
+                oldest = conn.execute('SELECT key, size FROM cache ORDER BY accessed LIMIT ?', (EVICT_BATCH,)).fetchall()
+                if not oldest:
+                    total = 0  # Nothing left to evict; the total had drifted
+                for old_key, old_size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute('DELETE FROM cache WHERE key = ?', (old_key,))
+                    total -= old_size
+                    evicted += 1
+                conn.execute('UPDATE cache_size SET total = ? WHERE id = 1', (total,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.stats.evictions += evicted
+
+    def usage(self):
+        conn = self._connection()
+        entries = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        size = conn.execute('SELECT total FROM cache_size WHERE id = 1').fetchone()[0]
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+class Cache:
+    """
+    Cache for computed project data and serialized API payloads.
+
+    Keys embed the version counter of the project or user they depend on, so
+    bumping the counter on every write (see bump_versions) makes stale
+    entries unreachable; they then age out of the backend.
+
+    The backend is chosen by CACHE_BACKEND: 'lru' (default, per process),
+    'sqlite' (file at CACHE_PATH, shared between workers) or 'null'.
+    """
+
+    def __init__(self):
+        self.backend = NullBackend()
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'lru')
+        max_bytes = int(app.config.get('CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        if kind == 'lru':
+            self.backend = LRUBackend(max_bytes)
+        elif kind == 'sqlite':
+            path = app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.sqlite3')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteBackend(path, max_bytes)
+        elif kind == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND {kind!r}')
+
+    def get_or_set(self, key, compute):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+        """
+        data = self.backend.get(key)
+        if data is not None:
+            return pickle.loads(data)
+        value = compute()
+        self.backend.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        return value
+
+    def peek(self, key):
+        """
+        Return the cached value for key, or None without computing anything.
+        """
+        data = self.backend.get(key)
+        return pickle.loads(data) if data is not None else None
+
+    def stats(self):
+        return {'backend': self.backend.name, **self.backend.stats.to_dict(), **self.backend.usage()}
+
+
+cache = Cache()
+
+
+def project_key(project, *parts):
+    """
+    Build a cache key scoped to the current version of a project.
+    """
+    return ':'.join(['project', str(project.id), f'v{project.version}', *map(str, parts)])
+
+
+def user_key(user, *parts, version=None):
+    """
+    Build a cache key scoped to the current version of a user's project list.
+
+    Unless the caller already has it from user_version, the version is read
+    from the database because current_user may come from the identity cache
+    and carry an older one.
+    """
+    if version is None:
+        version = user_version(user.id)
+    return ':'.join(['user', str(user.id), f'v{version}', *map(str, parts)])
+
+
+def user_version(user_id):
+    """
+    Read the current version of a user's project list (a primary-key lookup).
+    """
+    return db.session.execute(select(User.version).where(User.id == user_id)).scalar()
+
+
+def bump_versions(project_id, user_ids=(), session=db.session):
+    """
+    Invalidate cached data of a project, its members and any extra users.
+
+    Must be called inside the transaction of every write that changes a
+    project (expenses, participants, settlement). Extra user IDs cover users
+    who just left the project.
+
+    Returns the new project version. The UPDATE holds the project row lock
+    until commit, so writes that stamp rows with it (Expense.seq,
+    Settlement.seq) should bump first; sequences then commit in order.
+    Writes outside Flask-SQLAlchemy (the async API) pass their own session.
+    """
+    session.execute(
+        update(Project).where(Project.id == project_id)
+        .values(version=Project.version + 1, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False},
+    )
+    creator_ids = select(Project.creator_id).where(Project.id == project_id)
+    member_ids = select(ProjectParticipant.user_id).where(ProjectParticipant.project_id == project_id)
+    session.execute(
+        update(User)
+        .where(or_(User.id.in_(creator_ids), User.id.in_(member_ids), User.id.in_(list(user_ids))))
+        .values(version=User.version + 1),
+        execution_options={'synchronize_session': False},
+    )
+    return session.execute(select(Project.version).where(Project.id == project_id)).scalar()
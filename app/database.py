@@ -0,0 +1,152 @@
+import os
+import random
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+# Prefix of the SQLALCHEMY_BINDS keys that hold read replicas
+REPLICA_BIND_PREFIX = 'replica_'
+# HTTP methods treated as read-only and eligible for replica routing
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Pragmas applied to every SQLite connection
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-65536',   # 64 MB page cache
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',  # 256 MB
+)
+
+# Async driver per backend, used by the async API (see app.async_api)
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'mysql': 'aiomysql', 'postgresql': 'asyncpg'}
+
+PROFILES = {
+    'mysql': {'pool_size': 5, 'max_overflow': 10, 'pool_recycle': 280, 'pool_timeout': 10},
+    'postgresql': {'pool_size': 5, 'max_overflow': 10, 'pool_recycle': 1800, 'pool_timeout': 10},
+    'sqlite': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 10},
+}
+
+
+def database_uri(env=os.environ):
+    """
+    Return the primary database URI for the profile selected by DB_PROFILE.
+
+    Profiles are 'mysql' (default), 'postgresql' and 'sqlite'. DATABASE_URL
+    overrides the URI of any profile; otherwise it is assembled from the
+    profile's own variables.
+    """
+    profile = env.get('DB_PROFILE', 'mysql')
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown DB_PROFILE {profile!r}, expected one of {sorted(PROFILES)}')
+    return env.get('DATABASE_URL') or _profile_uri(profile, env)
+
+
+def engine_options(uri, env=os.environ):
+    """
+    Return the engine options for a URI, based on the defaults of its backend.
+
+    Pool settings can be tuned with DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE and DB_POOL_TIMEOUT.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}  # In-memory databases use a single static connection
+    options = {'pool_pre_ping': backend != 'sqlite', **PROFILES.get(backend, {})}
+    for key, name in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                      ('pool_recycle', 'DB_POOL_RECYCLE'), ('pool_timeout', 'DB_POOL_TIMEOUT')):
+        if env.get(name):
+            options[key] = int(env[name])
+    return options
+
+
+def async_database_uri(uri):
+    """
+    Return a URI for the same database through the async driver of its backend.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend!r} databases, expected one of {sorted(ASYNC_DRIVERS)}')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}').render_as_string(hide_password=False)
+
+
+def replica_binds(env=os.environ):
+    """
+    Return SQLALCHEMY_BINDS entries for the read replicas in DATABASE_REPLICA_URLS (comma-separated).
+    """
+    urls = [url.strip() for url in env.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    return {f'{REPLICA_BIND_PREFIX}{i}': {'url': url, **engine_options(url, env)} for i, url in enumerate(urls)}
+
+
+def _profile_uri(profile, env):
+    if profile == 'mysql':
+        user = env.get('MYSQL_USER', 'tobiasvonarx')
+        host = env.get('MYSQL_HOST', 'tobiasvonarx.mysql.pythonanywhere-services.com')
+        name = env.get('MYSQL_DATABASE', 'tobiasvonarx$expenses')
+        return f"mysql+pymysql://{user}:{env.get('MYSQL_PASSWORD')}@{host}/{name}"
+    if profile == 'postgresql':
+        user = env.get('POSTGRES_USER', 'postgres')
+        host = env.get('POSTGRES_HOST', 'localhost')
+        name = env.get('POSTGRES_DB', 'expenses')
+        return f"postgresql+psycopg2://{user}:{env.get('POSTGRES_PASSWORD', '')}@{host}/{name}"
+    return f"sqlite:///{env.get('SQLITE_PATH', os.path.abspath('expenses.db'))}"
+
+
+def init_database(app, db):
+    """
+    Apply per-connection tuning to the engines created by Flask-SQLAlchemy.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            tune_engine(engine)
+
+
+def tune_engine(engine):
+    """
+    Apply per-connection tuning to an engine (for async engines, pass engine.sync_engine).
+    """
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads of read-only requests to a replica.
+
+    Statements run on the primary when the request is not a GET/HEAD/OPTIONS,
+    outside of requests, for locking reads and for anything that writes.
+    Once a session has written, later reads in the same session also go to
+    the primary so they see their own changes. A session sticks to one
+    randomly chosen replica for consistent reads.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replica = self.info.get('replica')
+            if replica is None:
+                keys = [key for key in self._db.engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+                replica = self.info['replica'] = random.choice(keys) if keys else False
+            if replica:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if self._flushing or isinstance(clause, UpdateBase):  # INSERT, UPDATE or DELETE
+            self.info['wrote'] = True
+        if self.info.get('wrote') or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        return has_request_context() and request.method in READ_ONLY_METHODS
@@ -2,6 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, FloatField, TextAreaField, SelectField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from .models import User
+from .money import valid_amount
 
 class RegistrationForm(FlaskForm):
     """
@@ -56,6 +57,10 @@ class ExpenseForm(FlaskForm):
     amount = FloatField('Amount', validators=[DataRequired()])
     submit = SubmitField('Add Expense')
 
+    def validate_amount(self, amount):
+        if not valid_amount(amount.data):
+            raise ValidationError('Not a finite number within range.')
+
 class ShareProjectForm(FlaskForm):
     """
     Form for sharing a project with another user.
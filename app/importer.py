@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from .models import db, User, Expense, ProjectParticipant
+from .money import to_cents, from_cents
+from . import ledger, rollups
+from .cache import bump_versions
+
+# Defaults, overridable with IMPORT_CHUNK_SIZE / IMPORT_MAX_ERRORS in the app config
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_ERRORS = 1000
+
+
+class ImportReport:
+    """
+    Outcome of a bulk import: counters, a capped list of row errors and timing.
+    """
+
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        seconds = time.perf_counter() - self.started
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round((self.imported + self.failed) / seconds) if seconds else None,
+        }
+
+
+def iter_csv_rows(stream):
+    """
+    Yield (line number, row dict) pairs from a binary CSV stream with a header row.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_ndjson_rows(stream):
+    """
+    Yield (line number, row dict) pairs from a binary newline-delimited JSON stream.
+
+    Lines that are not JSON objects are yielded as strings so the importer
+    can report them as row errors.
+    """
+    for line_num, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, 'Row is not valid JSON.'
+            continue
+        yield line_num, row if isinstance(row, dict) else 'Row is not a JSON object.'
+
+
+def payer_lookup(project):
+    """
+    Map the username and email of every project member to their user ID, in one query.
+    """
+    member_ids = select(ProjectParticipant.user_id).where(ProjectParticipant.project_id == project.id)
+    rows = db.session.execute(
+        select(User.id, User.username, User.email)
+        .where((User.id == project.creator_id) | User.id.in_(member_ids))
+    )
+    lookup = {}
+    for user_id, username, email in rows:
+        lookup[username] = user_id
+        lookup[email.lower()] = user_id
+    return lookup
+
+
+def import_expenses(project, rows, default_payer_id, chunk_size=DEFAULT_CHUNK_SIZE, max_errors=DEFAULT_MAX_ERRORS):
+    """
+    Validate and insert expense rows into a project in chunks.
+
+    Args:
+        project (Project): Project receiving the expenses.
+        rows (iterable): (line number, row) pairs as produced by iter_csv_rows
+            or iter_ndjson_rows. A row holds `description`, `amount` and
+            optionally `payer` (username or email of a member, defaults to
+            `default_payer_id`) and `created_at` (ISO 8601).
+        default_payer_id (int): User ID used for rows without a payer.
+        chunk_size (int): Number of rows inserted and committed per batch.
+        max_errors (int): Maximum number of row errors kept in the report.
+
+    Returns:
+        ImportReport: Counters, row errors and throughput.
+
+    Rows are validated with the same rules as ExpenseForm. Each chunk is
+    written with one executemany INSERT plus one ledger update per payer and
+    committed on its own, so memory stays bounded regardless of file size.
+    """
+    from .forms import ExpenseForm
+
+    report = ImportReport(max_errors)
+    payers = payer_lookup(project)
+    # One form instance re-processed per row; binding fields per row dominates otherwise.
+    form = ExpenseForm(formdata=None, meta={'csrf': False})
+    chunk = []
+
+    for line, row in rows:
+        if isinstance(row, str):
+            report.add_error(line, row)
+            continue
+        values, error = _validate_row(form, row, payers, default_payer_id)
+        if error:
+            report.add_error(line, error)
+            continue
+        values['project_id'] = project.id
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            _flush_chunk(project, chunk)
+            report.imported += len(chunk)
+            chunk = []
+
+    if chunk:
+        _flush_chunk(project, chunk)
+        report.imported += len(chunk)
+    return report
+
+
+def _validate_row(form, row, payers, default_payer_id):
+    amount = row.get('amount')
+    form.process(MultiDict({
+        'description': row.get('description') or '',
+        'amount': '' if amount is None else str(amount),
+    }))
+    if not form.validate():
+        field, messages = next((name, errors) for name, errors in form.errors.items())
+        return None, f'{field}: {messages[0]}'
+    max_length = Expense.__table__.c.description.type.length
+    if len(form.description.data) > max_length:
+        return None, f'description: Longer than {max_length} characters.'
+
+    payer = (row.get('payer') or '').strip()
+    if payer:
+        payer_id = payers.get(payer) or payers.get(payer.lower())
+        if payer_id is None:
+            return None, f'payer: {payer!r} is not a member of this project.'
+    else:
+        payer_id = default_payer_id
+
+    created_at = row.get('created_at')
+    if created_at:
+        try:
+            created_at = datetime.fromisoformat(str(created_at))
+        except ValueError:
+            return None, f'created_at: {created_at!r} is not an ISO 8601 date.'
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)  # Stored as naive UTC
+    else:
+        created_at = datetime.utcnow()  # Every row carries the same keys so chunks stay one executemany
+
+    amount_cents = to_cents(form.amount.data)
+    return {'description': form.description.data, 'amount': from_cents(amount_cents), 'amount_cents': amount_cents,
+            'user_id': payer_id, 'created_at': created_at}, None
+
+
+def _flush_chunk(project, chunk):
+    seq = bump_versions(project.id)
+    for values in chunk:
+        values['seq'] = seq
+    db.session.execute(insert(Expense), chunk)
+    paid = {}
+    spend = []
+    for values in chunk:
+        cents = values['amount_cents']
+        total, count = paid.get(values['user_id'], (0, 0))
+        paid[values['user_id']] = (total + cents, count + 1)
+        spend.append((values['user_id'], values['created_at'], cents))
+    for user_id, (total, count) in paid.items():
+        ledger.record_expense(project.id, user_id, total, count)
+    rollups.record_expenses(project.id, spend)
+    db.session.commit()
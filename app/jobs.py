@@ -0,0 +1,307 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .models import db, User, Project, Expense, ArchivedExpense, Job
+from .cache import bump_versions
+from .money import from_cents
+from . import ledger, rollups
+
+logger = logging.getLogger(__name__)
+
+# CLI group registered by create_app: `flask jobs resume`
+jobs_cli = AppGroup('jobs', help='Run persisted background jobs.')
+
+# Job states; QUEUED and RUNNING jobs hold their project's active slot
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+# Expenses read per batch by the export job
+EXPORT_BATCH = 5000
+# Times enqueue() retries when the active job it collided with finished meanwhile
+ENQUEUE_ATTEMPTS = 3
+
+# Handlers by job kind, filled by @handler
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Register a function as the handler of a job kind.
+
+    Handlers are called as handler(job) inside an app context of their own
+    and return a JSON-serializable result. They commit their own work and
+    may call report() between transactions.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobRunner:
+    """
+    Runs persisted jobs on a local thread pool.
+
+    Jobs are rows in the job table, so queued work survives a restart:
+    resume() requeues jobs whose worker died and submits every queued job.
+    A unique index on Job.active_project_id keeps at most one queued or
+    running job per project, across all worker processes.
+
+    JOB_WORKERS sets the pool size; 0 runs jobs inline in the caller, which
+    is useful for tests and CLI use. JOB_STALE_SECONDS is how long a running
+    job may go without a progress report before resume() takes it over.
+
+    create_app() only calls resume() when JOB_RESUME is set (env
+    JOB_RESUME=1), which belongs in the environment of the serving workers
+    alone: CLI commands, datagen and benchmarks also build the app and
+    must not claim other processes' jobs. `flask jobs resume` runs the
+    queued jobs explicitly and waits for them.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.executor = None
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 2)
+        app.config.setdefault('JOB_STALE_SECONDS', 300)
+        app.config.setdefault('JOB_EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+        self.app = app
+        workers = app.config['JOB_WORKERS']
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job') if workers else None
+
+    def enqueue(self, kind, project_id, user_id, params=None):
+        """
+        Persist a job and hand it to the pool.
+
+        Returns (job, created). If the project already has an active job, no
+        job is created and that job is returned instead.
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f'Unknown job kind {kind!r}')
+        for attempt in range(ENQUEUE_ATTEMPTS):
+            job = Job(kind=kind, project_id=project_id, user_id=user_id, params=params or {},
+                      status=QUEUED, active_project_id=project_id)
+            db.session.add(job)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                active = db.session.execute(select(Job).where(Job.active_project_id == project_id)).scalar_one_or_none()
+                if active is not None:
+                    return active, False
+                if attempt == ENQUEUE_ATTEMPTS - 1:
+                    raise
+                # The active job finished between our insert and the lookup; the slot is free again.
+        self.submit(job.id)
+        db.session.commit()  # End the read transaction so the job reloads with its latest state
+        return job, True
+
+    def submit(self, job_id):
+        if self.executor is None:
+            self.run(job_id)
+        else:
+            self.executor.submit(self.run, job_id)
+
+    def resume(self):
+        """
+        Requeue running jobs with a stale heartbeat and submit all queued jobs.
+
+        Returns the number of jobs submitted.
+        """
+        stale = datetime.utcnow() - timedelta(seconds=self.app.config['JOB_STALE_SECONDS'])
+        db.session.execute(
+            update(Job).where(Job.status == RUNNING, Job.heartbeat_at < stale)
+            .values(status=QUEUED, message='Requeued after restart')
+        )
+        db.session.commit()
+        job_ids = db.session.scalars(select(Job.id).where(Job.status == QUEUED).order_by(Job.id)).all()
+        for job_id in job_ids:
+            self.submit(job_id)
+        return len(job_ids)
+
+    def run(self, job_id):
+        """
+        Claim a queued job and run its handler in a fresh app context.
+        """
+        with self.app.app_context():
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, Job.status == QUEUED)
+                .values(status=RUNNING, started_at=now, heartbeat_at=now)
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return  # Another worker got it first
+            job = db.session.get(Job, job_id)
+            try:
+                result = HANDLERS[job.kind](job)
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Job %s (%s) failed', job_id, job.kind)
+                job.status, job.error = FAILED, str(e)[:1000]
+            else:
+                job.status, job.result = DONE, result
+                if job.progress_total is not None:
+                    job.progress_done = job.progress_total
+            job.finished_at = job.heartbeat_at = datetime.utcnow()
+            job.active_project_id = None
+            db.session.commit()
+
+
+jobs = JobRunner()
+
+
+def report(job, done, total=None, message=None):
+    """
+    Record a job's progress and refresh its heartbeat.
+
+    This commits the session, so call it between units of work.
+    """
+    job.progress_done = done
+    if total is not None:
+        job.progress_total = total
+    if message is not None:
+        job.message = message
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+
+
+@contextlib.contextmanager
+def keepalive(job):
+    """
+    Keep refreshing a job's heartbeat while the block runs one long transaction.
+
+    report() would commit the transaction, so a thread updates heartbeat_at
+    on a connection of its own every third of JOB_STALE_SECONDS until the
+    block exits. If the worker dies the thread dies with it and the job
+    still goes stale.
+    """
+    job_id, engine, stop = job.id, db.engine, threading.Event()
+    interval = current_app.config['JOB_STALE_SECONDS'] / 3
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(update(Job).where(Job.id == job_id).values(heartbeat_at=datetime.utcnow()))
+            except OperationalError:
+                # SQLite: the job's own transaction holds the write lock, which keeps resume() out as well
+                logger.debug('Heartbeat of job %s skipped', job_id)
+
+    thread = threading.Thread(target=beat, name=f'job-{job_id}-keepalive', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def job_to_dict(job):
+    progress = job.progress_done / job.progress_total if job.progress_total else None
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'project_id': job.project_id,
+        'status': job.status,
+        'progress': round(progress, 4) if progress is not None else None,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def export_path(job):
+    return os.path.join(current_app.config['JOB_EXPORT_DIR'], f'project-{job.project_id}-job-{job.id}.ndjson')
+
+
+@handler('settle')
+def settle_job(job):
+    """
+    Settle every open expense of the project, as the settle route does inline.
+    """
+    project = db.session.get(Project, job.project_id)
+    report(job, 0, 1, 'Settling open expenses')
+    with keepalive(job):
+        record = ledger.settle_project(project, job.user_id, exact=current_app.config.get('SETTLEMENT_EXACT', True))
+        if record is None:
+            db.session.rollback()  # Undo the version bump
+            return {'settlement_id': None, 'expense_count': 0}
+        db.session.commit()
+    return {'settlement_id': record.id, 'expense_count': record.expense_count, 'total_cents': record.total_cents}
+
+
+@handler('recompute')
+def recompute_job(job):
+    """
+    Rebuild the ledger and spend rollups of the project from its expenses.
+
+    Both run in one transaction that starts with the version bump, so
+    concurrent writers queue on the project row until the rebuild commits.
+    """
+    report(job, 0, 1, 'Rebuilding ledger and rollups')
+    with keepalive(job):
+        bump_versions(job.project_id)
+        drift = ledger.rebuild_ledger(job.project_id, commit=False)
+        written = rollups.backfill(job.project_id, commit=False)
+        db.session.commit()
+    return {'ledger_rows_fixed': len(drift), 'rollup_rows': written}
+
+
+@handler('export')
+def export_job(job):
+    """
+    Write every open and archived expense of the project to an NDJSON file.
+
+    Rows are read in keyset batches so progress can be committed between them.
+    """
+    total = sum(db.session.execute(select(func.count()).where(model.project_id == job.project_id)).scalar()
+                for model in (Expense, ArchivedExpense))
+    report(job, 0, total, 'Exporting expenses')
+    path = export_path(job)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, 'w') as out:
+        for model, state in ((ArchivedExpense, 'settled'), (Expense, 'open')):
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    select(model.id, model.description, model.amount_cents, model.created_at, User.username)
+                    .join(User, model.user_id == User.id)
+                    .where(model.project_id == job.project_id, model.id > last_id)
+                    .order_by(model.id)
+                    .limit(EXPORT_BATCH)
+                ).all()
+                if not rows:
+                    break
+                for row in rows:
+                    out.write(json.dumps({'id': row.id, 'description': row.description, 'amount': from_cents(row.amount_cents),
+                                          'user': row.username, 'state': state,
+                                          'created_at': row.created_at.isoformat() if row.created_at else None}) + '\n')
+                written += len(rows)
+                last_id = rows[-1].id
+                report(job, written, max(total, written))
+    return {'rows': written, 'file': os.path.basename(path)}
+
+
+@jobs_cli.command('resume')
+def resume_command():
+    """Requeue interrupted jobs and run every queued job to completion."""
+    submitted = jobs.resume()
+    if jobs.executor is not None:
+        jobs.executor.shutdown(wait=True)
+    click.echo(f'{submitted} job(s) run.')
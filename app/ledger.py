@@ -0,0 +1,277 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, update, delete, insert, func, literal
+from .models import db, Expense, Project, ProjectParticipant, ProjectBalance, Settlement, ArchivedExpense
+from . import settlement as settlement_engine
+from . import rollups
+from .cache import bump_versions
+from .money import from_cents
+
+# CLI group registered by create_app: `flask ledger rebuild` / `flask ledger verify`
+ledger_cli = AppGroup('ledger', help='Maintain the per-project balance ledger.')
+
+
+def add_participant(project_id, user_id):
+    """
+    Ensure a (zeroed) ledger row exists for a user joining a project.
+    """
+    if db.session.get(ProjectBalance, (project_id, user_id)) is None:
+        db.session.add(ProjectBalance(project_id=project_id, user_id=user_id,
+                                      total_paid_cents=0, expense_count=0))
+
+
+def remove_participant(project_id, user_id):
+    """
+    Drop the ledger row of a user leaving a project.
+
+    Rows that still carry unsettled expenses are kept, because those expenses
+    continue to count towards the project total.
+    """
+    db.session.execute(
+        delete(ProjectBalance)
+        .where(ProjectBalance.project_id == project_id,
+               ProjectBalance.user_id == user_id,
+               ProjectBalance.expense_count == 0)
+    )
+
+
+def record_expense(project_id, user_id, amount_cents, count=1, session=db.session):
+    """
+    Add one or more expenses paid by a user to the ledger.
+
+    The increment is applied as a single UPDATE so concurrent writers don't
+    lose each other's changes; the row is created on first use.
+    """
+    result = session.execute(
+        update(ProjectBalance)
+        .where(ProjectBalance.project_id == project_id, ProjectBalance.user_id == user_id)
+        .values(total_paid_cents=ProjectBalance.total_paid_cents + amount_cents,
+                expense_count=ProjectBalance.expense_count + count)
+    )
+    if result.rowcount == 0:
+        session.add(ProjectBalance(project_id=project_id, user_id=user_id,
+                                   total_paid_cents=amount_cents, expense_count=count))
+
+
+def add_expense(project_id, user_id, description, amount_cents, session=db.session):
+    """
+    Insert an expense paid by a user and book it in the ledger and rollups.
+
+    This is the write path of both the sync views and the async API, which
+    passes the sync session behind its AsyncSession. Everything happens in
+    the caller's transaction; the versions are bumped first so the expense
+    carries the new change sequence. Returns the flushed Expense.
+    """
+    seq = bump_versions(project_id, session=session)
+    expense = Expense(description=description, amount=from_cents(amount_cents), amount_cents=amount_cents,
+                      user_id=user_id, project_id=project_id, created_at=datetime.utcnow(), seq=seq)
+    session.add(expense)
+    session.flush()  # Assigns expense.id
+    record_expense(project_id, user_id, amount_cents, session=session)
+    rollups.record_expenses(project_id, [(user_id, expense.created_at, amount_cents)], session=session)
+    return expense
+
+
+def reset_project(project_id):
+    """
+    Zero every ledger row of a project after its expenses have been settled.
+    """
+    db.session.execute(
+        update(ProjectBalance)
+        .where(ProjectBalance.project_id == project_id)
+        .values(total_paid_cents=0, expense_count=0)
+    )
+
+
+def settle_project(project, settled_by_id, exact=True):
+    """
+    Settle every open expense of a project as one set-based operation.
+
+    Writes a Settlement record with the per-user totals and transfers, moves
+    the expenses into archived_expense with one INSERT ... SELECT, removes
+    them with one DELETE and zeroes the ledger, all in the caller's
+    transaction, after bumping the project versions. Returns the Settlement,
+    or None if there was nothing to settle (the caller should roll back).
+
+    If the ledger's expense count disagrees with the expense table, the
+    totals are recomputed from the expenses instead of trusting the ledger.
+    """
+    # Lock the project row (through the version bump) before the ledger rows,
+    # in the same order as add_expense and imports, so they queue instead of
+    # deadlocking; the bump also gives the settlement its change sequence.
+    seq = bump_versions(project.id)
+    paid = {
+        user_id: (total, count)
+        for user_id, total, count in db.session.execute(
+            select(ProjectBalance.user_id, ProjectBalance.total_paid_cents, ProjectBalance.expense_count)
+            .where(ProjectBalance.project_id == project.id)
+            .with_for_update()
+        )
+    }
+    last_id, open_count = db.session.execute(
+        select(func.max(Expense.id), func.count()).where(Expense.project_id == project.id)
+    ).one()
+    if last_id is None:
+        return None
+    if open_count != sum(count for _, count in paid.values()):
+        # The ledger missed expenses (e.g. rows written before it existed);
+        # settle from the expense table so the record keeps who owed whom.
+        paid = {
+            user_id: (int(total), count)
+            for user_id, total, count in db.session.execute(
+                select(Expense.user_id, func.sum(Expense.amount_cents), func.count())
+                .where(Expense.project_id == project.id, Expense.id <= last_id)
+                .group_by(Expense.user_id)
+            )
+        }
+
+    members = [project.creator_id] + list(db.session.scalars(
+        select(ProjectParticipant.user_id).where(ProjectParticipant.project_id == project.id)
+    ))
+    balances = settlement_engine.net_balances({user_id: total for user_id, (total, _) in paid.items()}, members)
+    transfers = settlement_engine.settle(balances, exact=exact)
+
+    record = Settlement(
+        project_id=project.id,
+        settled_by_id=settled_by_id,
+        expense_count=sum(count for _, count in paid.values()),
+        total_cents=sum(total for total, _ in paid.values()),
+        totals=[{'user_id': user_id, 'paid_cents': total, 'expense_count': count}
+                for user_id, (total, count) in sorted(paid.items()) if count],
+        transfers=[{'payer_id': t.payer, 'receiver_id': t.receiver, 'amount_cents': t.amount_cents}
+                   for t in transfers],
+        seq=seq,  # Tombstone sequence for the changes feed
+    )
+    db.session.add(record)
+    db.session.flush()  # Assigns record.id for the archived rows
+    rollups.record_settlement(record)
+
+    settled = (Expense.project_id == project.id, Expense.id <= last_id)
+    columns = ['id', 'description', 'amount', 'amount_cents', 'user_id', 'project_id', 'created_at', 'seq']
+    db.session.execute(
+        insert(ArchivedExpense).from_select(
+            columns + ['settlement_id'],
+            select(*(getattr(Expense, name) for name in columns), literal(record.id)).where(*settled),
+        )
+    )
+    db.session.execute(delete(Expense).where(*settled), execution_options={'synchronize_session': False})
+    reset_project(project.id)
+    return record
+
+
+def get_balances(project_id):
+    """
+    Return the ledger of a project as {user_id: (total_paid_cents, expense_count)}.
+
+    This is a single primary-key range lookup, independent of the number of expenses.
+    """
+    rows = db.session.execute(
+        select(ProjectBalance.user_id, ProjectBalance.total_paid_cents, ProjectBalance.expense_count)
+        .where(ProjectBalance.project_id == project_id)
+    )
+    return {user_id: (total, count) for user_id, total, count in rows}
+
+
+def compute_ledger(project_id=None):
+    """
+    Recompute ledger totals from the expense table.
+
+    Amounts are integer cents, so the totals are summed exactly by the
+    database in one GROUP BY and are comparable to the stored ledger.
+    Returns {(project_id, user_id): (total_paid_cents, expense_count)}.
+    """
+    stmt = (
+        select(Expense.project_id, Expense.user_id, func.sum(Expense.amount_cents), func.count())
+        .group_by(Expense.project_id, Expense.user_id)
+    )
+    if project_id is not None:
+        stmt = stmt.where(Expense.project_id == project_id)
+    return {(pid, uid): (int(total), count) for pid, uid, total, count in db.session.execute(stmt)}
+
+
+def verify_ledger(project_id=None, expected=None):
+    """
+    Compare the stored ledger with the expense table.
+
+    Returns a list of drift entries (project_id, user_id, expected, actual),
+    where expected and actual are (total_paid_cents, expense_count) tuples.
+    A precomputed result of compute_ledger may be passed as `expected`.
+    """
+    if expected is None:
+        expected = compute_ledger(project_id)
+    stmt = select(ProjectBalance.project_id, ProjectBalance.user_id,
+                  ProjectBalance.total_paid_cents, ProjectBalance.expense_count)
+    if project_id is not None:
+        stmt = stmt.where(ProjectBalance.project_id == project_id)
+    actual = {(pid, uid): (total, count) for pid, uid, total, count in db.session.execute(stmt)}
+
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, (0, 0))
+        have = actual.get(key, (0, 0))
+        if want != have:
+            drift.append((key[0], key[1], want, have))
+    return drift
+
+
+def rebuild_ledger(project_id=None, commit=True):
+    """
+    Rewrite the ledger from the expense table and return the drift that was fixed.
+
+    Zero rows are kept for the creator and every participant of the project(s).
+    With commit=False the rows are only flushed, for callers that rebuild
+    more in the same transaction.
+    """
+    expected = compute_ledger(project_id)
+    drift = verify_ledger(project_id, expected)
+
+    delete_stmt = delete(ProjectBalance)
+    creators_stmt = select(Project.id, Project.creator_id)
+    participants_stmt = select(ProjectParticipant.project_id, ProjectParticipant.user_id)
+    if project_id is not None:
+        delete_stmt = delete_stmt.where(ProjectBalance.project_id == project_id)
+        creators_stmt = creators_stmt.where(Project.id == project_id)
+        participants_stmt = participants_stmt.where(ProjectParticipant.project_id == project_id)
+    db.session.execute(delete_stmt)
+
+    for stmt in (creators_stmt, participants_stmt):
+        for pid, uid in db.session.execute(stmt):
+            expected.setdefault((pid, uid), (0, 0))
+
+    db.session.add_all(
+        ProjectBalance(project_id=pid, user_id=uid, total_paid_cents=total, expense_count=count)
+        for (pid, uid), (total, count) in expected.items()
+    )
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    return drift
+
+
+def _report(drift):
+    for project_id, user_id, (want_total, want_count), (have_total, have_count) in drift:
+        click.echo(f'project {project_id} user {user_id}: '
+                   f'expected {want_total} cents / {want_count} expenses, '
+                   f'ledger has {have_total} cents / {have_count} expenses')
+
+
+@ledger_cli.command('verify')
+@click.option('--project', 'project_id', type=int, default=None, help='Only check this project.')
+def verify_command(project_id):
+    """Report drift between the ledger and the expense table."""
+    drift = verify_ledger(project_id)
+    _report(drift)
+    click.echo(f'{len(drift)} ledger row(s) out of sync.')
+    if drift:
+        raise SystemExit(1)
+
+
+@ledger_cli.command('rebuild')
+@click.option('--project', 'project_id', type=int, default=None, help='Only rebuild this project.')
+def rebuild_command(project_id):
+    """Recompute the ledger from the expense table."""
+    drift = rebuild_ledger(project_id)
+    _report(drift)
+    click.echo(f'Ledger rebuilt, {len(drift)} row(s) corrected.')
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g, current_app
+from sqlalchemy import select, exists, or_, and_
+from sqlalchemy.orm import make_transient_to_detached
+from .models import db, User, Project, ProjectParticipant
+from .cache import cache, project_key
+
+# Defaults, overridable with IDENTITY_CACHE_TTL / IDENTITY_CACHE_SIZE in the app config
+DEFAULT_IDENTITY_TTL = 30
+DEFAULT_IDENTITY_SIZE = 10000
+
+
+def members(project):
+    """
+    Return the members of a project as a list of (user_id, username), creator first.
+
+    The list is memoized for the request and cached under the project's
+    version, which is bumped whenever a ProjectParticipant row changes, so it
+    costs one indexed query per project change rather than per request.
+    """
+    memo = g.setdefault('project_members', {})
+    key = project_key(project, 'members')
+    if key not in memo:
+        memo[key] = cache.get_or_set(key, lambda: _load_members(project))
+    return memo[key]
+
+
+def member_ids(project):
+    """
+    Return the user IDs of every member of a project as a frozenset.
+    """
+    memo = g.setdefault('project_member_ids', {})
+    key = project_key(project, 'members')
+    if key not in memo:
+        memo[key] = frozenset(user_id for user_id, _ in members(project))
+    return memo[key]
+
+
+def is_member(project, user_id):
+    """
+    Check whether a user created or participates in a project.
+
+    Uses the cached member set when it is available and otherwise falls
+    back to a single EXISTS query instead of loading the whole set.
+    """
+    if user_id == project.creator_id:
+        return True
+    key = project_key(project, 'members')
+    memo = g.get('project_member_ids', {})
+    if key in memo:
+        return user_id in memo[key]
+    cached = cache.peek(key)
+    if cached is not None:
+        return any(member_id == user_id for member_id, _ in cached)
+    return user_can_access(project.id, user_id)
+
+
+def user_can_access(project_id, user_id):
+    """
+    Check project access with one EXISTS query, without loading the project.
+    """
+    return db.session.execute(select(or_(
+        exists().where(and_(Project.id == project_id, Project.creator_id == user_id)),
+        exists().where(and_(ProjectParticipant.project_id == project_id, ProjectParticipant.user_id == user_id)),
+    ))).scalar()
+
+
+def _load_members(project):
+    creator = db.session.execute(select(User.id, User.username).where(User.id == project.creator_id)).one()
+    participants = db.session.execute(
+        select(User.id, User.username)
+        .join(ProjectParticipant, ProjectParticipant.user_id == User.id)
+        .where(ProjectParticipant.project_id == project.id)
+        .order_by(ProjectParticipant.id)
+    ).all()
+    return [tuple(creator)] + [tuple(row) for row in participants]
+
+
+class IdentityCache:
+    """
+    Short-lived, per-process cache of User column values for load_user.
+
+    A hit rebuilds the User and attaches it to the session without SQL, so
+    authenticated requests skip the user lookup for IDENTITY_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        ttl = current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_IDENTITY_TTL)
+        if ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            values = entry[1]
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def set(self, user):
+        ttl = current_app.config.get('IDENTITY_CACHE_TTL', DEFAULT_IDENTITY_TTL)
+        if ttl <= 0:
+            return
+        values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + ttl, values)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > current_app.config.get('IDENTITY_CACHE_SIZE', DEFAULT_IDENTITY_SIZE):
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import deque
+from flask import g, request, has_request_context, current_app, Response, abort, jsonify, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) shared by the timing metrics
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets for the number of queries issued by one request
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+# Number of slow queries kept for inspection
+SLOW_LOG_SIZE = 100
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised in debug mode when a request issues more queries than its budget allows.
+    """
+
+
+class Counter:
+    """
+    Prometheus counter with labels.
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram with labels and fixed buckets.
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                # Cumulative bucket counts, sum of observations, number of observations
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _labels(self.labels + ('le',), label_values + (_format(bound),))
+                    lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), label_values + ("+Inf",))} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class RequestStats:
+    """
+    Counters collected while a single request is handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows_written = 0
+        self.render_time = 0.0
+        self.render_started = None
+
+
+class Metrics:
+    """
+    Per-request SQL and timing instrumentation with a Prometheus /metrics endpoint.
+
+    Hooks SQLAlchemy cursor events and Flask request/template signals to
+    record, per endpoint, query count, DB time, rows written (INSERT,
+    UPDATE and DELETE row counts; drivers report none for reads, e.g.
+    SQLite's -1 for SELECT), template render time and wall time. Statements
+    slower than SLOW_QUERY_MS are logged and kept in slow_queries.
+
+    When the app runs in debug mode (or QUERY_BUDGET_ENFORCE is set), a
+    request issuing more queries than QUERY_BUDGETS[endpoint] (falling back
+    to QUERY_BUDGET_DEFAULT) raises QueryBudgetExceeded.
+
+    Both /metrics and /metrics/slow_queries only answer local requests
+    unless METRICS_ALLOW_REMOTE is set.
+    """
+
+    def __init__(self):
+        self.slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+        self.requests = Counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.queries = Counter('db_queries_total', 'SQL statements executed.', ('endpoint',))
+        self.rows_written = Counter('db_rows_written_total', 'Rows changed by INSERT, UPDATE and DELETE statements.', ('endpoint',))
+        self.slow = Counter('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('endpoint',))
+        self.wall_time = Histogram('http_request_duration_seconds', 'Wall time per request.', ('endpoint',))
+        self.db_time = Histogram('db_time_seconds', 'Time spent in SQL per request.', ('endpoint',))
+        self.render_time = Histogram('template_render_seconds', 'Template render time per request.', ('endpoint',))
+        self.query_count = Histogram('db_queries_per_request', 'SQL statements per request.', ('endpoint',),
+                                     buckets=QUERY_BUCKETS)
+        self.slow_query_seconds = None
+        self._listening = False
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 200)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.config.setdefault('QUERY_BUDGET_DEFAULT', None)
+        app.config.setdefault('QUERY_BUDGET_ENFORCE', app.debug)
+        app.config.setdefault('METRICS_ALLOW_REMOTE', False)
+
+        self.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000 if app.config['SLOW_QUERY_MS'] else None
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        app.add_url_rule('/metrics/slow_queries', 'slow_queries', self._slow_queries_view)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        stats = g.get('request_stats') if has_request_context() else None
+        endpoint = (request.endpoint or 'unknown') if has_request_context() else 'none'
+        # Only statements without a result set (writes) have a meaningful row count
+        written = cursor.rowcount if cursor.description is None and cursor.rowcount > 0 else 0
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            stats.rows_written += written
+        else:
+            # Work outside a request (CLI commands, jobs) is counted right away.
+            self.queries.inc((endpoint,))
+            self.rows_written.inc((endpoint,), written)
+
+        if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+            self.slow.inc((endpoint,))
+            self.slow_queries.append({'endpoint': endpoint, 'ms': round(elapsed * 1000, 3),
+                                      'statement': statement[:1000], 'at': time.time()})
+            logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, endpoint, statement)
+
+    def _before_render(self, app, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is not None and stats.render_started is None:
+            stats.render_started = time.perf_counter()
+
+    def _after_render(self, app, template, context, **extra):
+        stats = g.get('request_stats')
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        labels = (endpoint,)
+        self.requests.inc((endpoint, request.method, str(response.status_code)))
+        self.queries.inc(labels, stats.queries)
+        self.rows_written.inc(labels, stats.rows_written)
+        self.wall_time.observe(labels, time.perf_counter() - stats.started)
+        self.db_time.observe(labels, stats.db_time)
+        self.render_time.observe(labels, stats.render_time)
+        self.query_count.observe(labels, stats.queries)
+
+        config = current_app.config
+        if config['QUERY_BUDGET_ENFORCE']:
+            budget = config['QUERY_BUDGETS'].get(endpoint, config['QUERY_BUDGET_DEFAULT'])
+            if budget is not None and stats.queries > budget:
+                raise QueryBudgetExceeded(
+                    f'{endpoint} issued {stats.queries} queries, budget is {budget}.')
+        return response
+
+    def _check_local(self):
+        if not current_app.config['METRICS_ALLOW_REMOTE'] and request.remote_addr not in ('127.0.0.1', '::1'):
+            abort(404)
+
+    def _metrics_view(self):
+        self._check_local()
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def _slow_queries_view(self):
+        self._check_local()
+        return jsonify(list(self.slow_queries))
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in (self.requests, self.queries, self.rows_written, self.slow,
+                       self.wall_time, self.db_time, self.render_time, self.query_count):
+            lines.extend(metric.render())
+
+        from .cache import cache
+        cache_stats = cache.stats()
+        for name in ('hits', 'misses', 'evictions'):
+            lines.append(f'# TYPE cache_{name}_total counter')
+            lines.append(f'cache_{name}_total{{backend="{cache_stats["backend"]}"}} {cache_stats[name]}')
+        for name in ('entries', 'bytes'):
+            lines.append(f'# TYPE cache_{name} gauge')
+            lines.append(f'cache_{name}{{backend="{cache_stats["backend"]}"}} {cache_stats[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -7,9 +7,16 @@ def load_user(user_id):
     """
     Callback function to reload the user object from the user ID.
 
-    Required by Flask-Login.
+    Required by Flask-Login. Recently loaded users are served from a
+    short-TTL identity cache without touching the database.
     """
-    return User.query.get(int(user_id))
+    from .membership import identity_cache
+    user = identity_cache.get(int(user_id))
+    if user is None:
+        user = User.query.get(int(user_id))
+        if user is not None:
+            identity_cache.set(user)
+    return user
 
 class User(db.Model, UserMixin):
     """
@@ -22,6 +29,7 @@ class User(db.Model, UserMixin):
         password (str): Hashed password.
         projects_created (list): List of projects created by the user.
         projects_shared (list): List of projects the user is participating in.
+        version (int): Change counter of the user's project list, used in cache keys.
     """
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
@@ -29,6 +37,7 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(256), nullable=False)
     projects_created = db.relationship('Project', backref='creator', lazy=True, cascade="all, delete-orphan")  # Projects created by the user
     projects_shared = db.relationship('ProjectParticipant', back_populates='user', cascade="all, delete-orphan")
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when any of the user's projects change
 
     def __repr__(self):
         return f"User('{self.username}', '{self.email}')"
@@ -43,14 +52,22 @@ class Project(db.Model):
         creator_id (int): Foreign key referencing the user who created the project.
         expenses (list): List of expenses associated with the project.
         participants (list): List of users participating in the project.
+        balances (list): Ledger rows holding each user's running totals.
+        settlements (list): Past settlements of the project.
         created_at (datetime): Timestamp of when the project was created.
+        version (int): Change counter of the project, used in cache keys, ETags and as the change sequence.
+        updated_at (datetime): Timestamp of the last write to the project, sent as Last-Modified.
     """
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     expenses = db.relationship('Expense', backref='project', lazy=True, cascade="all, delete-orphan")
     participants = db.relationship('ProjectParticipant', back_populates='project', cascade="all, delete-orphan")
+    balances = db.relationship('ProjectBalance', lazy=True, cascade="all, delete-orphan")
+    settlements = db.relationship('Settlement', backref='project', lazy=True, cascade="all, delete-orphan")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every write to the project
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f"Project('{self.name}')"
@@ -62,19 +79,43 @@ class Expense(db.Model):
     Attributes:
         id (int): Primary key, unique expense ID.
         description (str): Description of the expense.
-        amount (float): Amount of the expense.
+        amount_cents (int): Amount of the expense in cents; the authoritative amount.
+        amount (float): Legacy float copy of the amount, written alongside amount_cents
+            for older readers and never used for arithmetic.
         user_id (int): Foreign key referencing the user who paid for the expense.
         project_id (int): Foreign key referencing the project the expense belongs to.
         created_at (datetime): Timestamp of when the expense was created.
         user (User): Relationship to the User model.
+        seq (int): Project version of the write that added the expense.
+
+    Indexes:
+        ix_expense_project_created: (project_id, created_at, id), backs keyset pagination.
+        ix_expense_project_seq: (project_id, seq), backs the changes feed.
+        ix_expense_project_user_created: (project_id, user_id, created_at), backs payer and date search filters.
+        ix_expense_project_amount_cents: (project_id, amount_cents), backs amount-range search filters.
+
+    Descriptions are full-text indexed by app.search (FTS5 table on SQLite,
+    FULLTEXT index on MySQL).
     """
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.BigInteger)  # Nullable so migrations can add it; `flask schema migrate` backfills it
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User', backref=db.backref('expenses', lazy=True)) #add user relationship
+    seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_expense_project_created', 'project_id', 'created_at', 'id'),
+        db.Index('ix_expense_project_seq', 'project_id', 'seq'),
+        db.Index('ix_expense_project_user_created', 'project_id', 'user_id', 'created_at'),
+        db.Index('ix_expense_project_amount_cents', 'project_id', 'amount_cents'),
+        # Settled expenses keep their ID in archived_expense (and the search index),
+        # so SQLite must not hand a deleted ID out again.
+        {'sqlite_autoincrement': True},
+    )
 
     def __repr__(self):
         return f"Expense('{self.description}', '{self.amount}')"
@@ -95,7 +136,7 @@ class ProjectParticipant(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     project = db.relationship('Project', back_populates='participants')
     user = db.relationship('User', back_populates='projects_shared')
 
@@ -103,4 +144,206 @@ class ProjectParticipant(db.Model):
         db.UniqueConstraint('project_id', 'user_id', name='_project_user_uc'),
     )
     def __repr__(self):
-        return f"ProjectParticipant(project_id={self.project_id}, user_id={self.user_id})"
\ No newline at end of file
+        return f"ProjectParticipant(project_id={self.project_id}, user_id={self.user_id})"
+
+class ProjectBalance(db.Model):
+    """
+    Materialized ledger row holding a user's running totals within a project.
+
+    Maintained by app.ledger in the same transaction as every expense,
+    settlement and participant change, so balances can be read without
+    aggregating the expense table.
+
+    Attributes:
+        project_id (int): Foreign key referencing the project, part of the primary key.
+        user_id (int): Foreign key referencing the user, part of the primary key.
+        total_paid_cents (int): Sum of the user's unsettled expenses, in cents.
+        expense_count (int): Number of the user's unsettled expenses.
+    """
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_paid_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"ProjectBalance(project_id={self.project_id}, user_id={self.user_id}, total_paid_cents={self.total_paid_cents})"
+
+
+class Settlement(db.Model):
+    """
+    Model representing a settlement of all open expenses in a project.
+
+    The settled expenses themselves are moved to ArchivedExpense, so the
+    expense table only ever holds the open ones.
+
+    Attributes:
+        id (int): Primary key, unique settlement ID.
+        project_id (int): Foreign key referencing the settled project.
+        settled_by_id (int): Foreign key referencing the user who settled.
+        settled_at (datetime): Timestamp of the settlement.
+        expense_count (int): Number of expenses settled.
+        total_cents (int): Sum of the settled expenses, in cents.
+        totals (list): Per-user dicts with user_id, paid_cents and expense_count.
+        transfers (list): Dicts with payer_id, receiver_id and amount_cents.
+        seq (int): Project version of the settlement, used for changes-feed tombstones.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False, index=True)
+    settled_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    settled_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expense_count = db.Column(db.Integer, nullable=False)
+    total_cents = db.Column(db.BigInteger, nullable=False)
+    totals = db.Column(db.JSON, nullable=False)
+    transfers = db.Column(db.JSON, nullable=False)
+    seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f"Settlement(project_id={self.project_id}, settled_at={self.settled_at})"
+
+class ArchivedExpense(db.Model):
+    """
+    Model representing an expense that has been settled.
+
+    Mirrors the Expense columns (keeping the original ID) and records the
+    settlement it belongs to.
+
+    Attributes:
+        id (int): Primary key, ID the expense had while open.
+        description (str): Description of the expense.
+        amount_cents (int): Amount of the expense in cents; the authoritative amount.
+        amount (float): Legacy float copy of the amount, written alongside amount_cents
+            for older readers and never used for arithmetic.
+        user_id (int): Foreign key referencing the user who paid for the expense.
+        project_id (int): Foreign key referencing the project the expense belonged to.
+        created_at (datetime): Timestamp of when the expense was created.
+        settlement_id (int): Foreign key referencing the settlement that archived it.
+        seq (int): Project version of the write that added the expense.
+
+    Indexes:
+        ix_archived_expense_settlement: (settlement_id, created_at, id), backs keyset pagination.
+        ix_archived_expense_project_created, ix_archived_expense_project_user_created and
+        ix_archived_expense_project_amount_cents: same as on Expense, back search over settled expenses.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.BigInteger)  # Nullable so migrations can add it; `flask schema migrate` backfills it
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    settlement_id = db.Column(db.Integer, db.ForeignKey('settlement.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_archived_expense_settlement', 'settlement_id', 'created_at', 'id'),
+        db.Index('ix_archived_expense_project_created', 'project_id', 'created_at', 'id'),
+        db.Index('ix_archived_expense_project_user_created', 'project_id', 'user_id', 'created_at'),
+        db.Index('ix_archived_expense_project_amount_cents', 'project_id', 'amount_cents'),
+    )
+
+    def __repr__(self):
+        return f"ArchivedExpense('{self.description}', '{self.amount}')"
+
+class DailySpend(db.Model):
+    """
+    Rollup of a user's spending in a project per calendar day (UTC).
+
+    Maintained by app.rollups in the same transaction as every expense and
+    settlement; settled expenses stay counted, as spending history.
+
+    Attributes:
+        project_id (int): Foreign key referencing the project, part of the primary key.
+        bucket (date): Day of the expenses, part of the primary key.
+        user_id (int): Foreign key referencing the paying user, part of the primary key.
+        paid_cents (int): Sum of the user's expenses on that day, in cents.
+        expense_count (int): Number of the user's expenses on that day.
+        settled_cents (int): Net balance cleared by settlements that day, positive when the user owed it.
+    """
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    bucket = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    paid_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    settled_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DailySpend(project_id={self.project_id}, bucket={self.bucket}, user_id={self.user_id})"
+
+class MonthlySpend(db.Model):
+    """
+    Rollup of a user's spending in a project per calendar month (UTC).
+
+    Same columns as DailySpend; bucket is the first day of the month.
+    """
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    bucket = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    paid_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    settled_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"MonthlySpend(project_id={self.project_id}, bucket={self.bucket}, user_id={self.user_id})"
+
+class Job(db.Model):
+    """
+    Model representing a background job, run by app.jobs.
+
+    Attributes:
+        id (int): Primary key, unique job ID.
+        kind (str): Registered handler name, e.g. 'settle' or 'export'.
+        project_id (int): Foreign key referencing the project the job works on.
+        user_id (int): Foreign key referencing the user who started the job.
+        status (str): 'queued', 'running', 'done' or 'failed'.
+        params (dict): Handler arguments.
+        result (dict): Handler return value once done.
+        error (str): Error message if the job failed.
+        progress_done (int): Units of work completed.
+        progress_total (int): Units of work expected, if known.
+        message (str): Human-readable description of the current step.
+        active_project_id (int): Equal to project_id while the job is queued or
+            running, NULL afterwards. Its unique index allows one active job per project.
+        created_at (datetime): Timestamp of when the job was queued.
+        started_at (datetime): Timestamp of when a worker picked the job up.
+        finished_at (datetime): Timestamp of when the job completed or failed.
+        heartbeat_at (datetime): Last progress report; running jobs with an old
+            heartbeat are requeued on startup.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)
+    message = db.Column(db.String(200))
+    active_project_id = db.Column(db.Integer, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"Job(id={self.id}, kind='{self.kind}', status='{self.status}')"
+
+class SchemaVersion(db.Model):
+    """
+    Single-row record of the schema version the database was migrated to.
+
+    Written by `flask schema migrate` (app.schema); production workers read
+    it at boot instead of inspecting every table.
+
+    Attributes:
+        id (int): Primary key, always 1.
+        version (int): Schema version, compared against app.schema.SCHEMA_VERSION.
+        migrated_at (datetime): Timestamp of the last migration.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    migrated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"SchemaVersion(version={self.version})"
@@ -0,0 +1,48 @@
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+# Largest amount, in cents, accepted from users; well within a BigInteger and Decimal's precision
+MAX_CENTS = 10 ** 15
+
+
+def to_cents(amount):
+    """
+    Convert a money amount (float, Decimal, int or numeric string) to integer cents.
+
+    Rounds half away from zero, going through the decimal string
+    representation so that values like 0.1 + 0.2 do not pick up float residue.
+    """
+    return int((Decimal(str(amount)) / CENT).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def valid_amount(amount):
+    """
+    Check that an int or float amount is finite and small enough for to_cents and amount_cents.
+
+    Ints are compared exactly: math.isfinite() raises OverflowError on ints
+    too large for a float, which JSON bodies can carry.
+    """
+    if isinstance(amount, int):
+        return abs(amount) * 100 <= MAX_CENTS
+    return math.isfinite(amount) and abs(amount) * 100 <= MAX_CENTS
+
+
+def from_cents(cents):
+    """
+    Convert integer cents back to a float amount for JSON output.
+    """
+    return cents / 100
+
+
+def format_cents(cents):
+    """
+    Format integer cents as a decimal string with two places, e.g. 1234 -> '12.34'.
+
+    Registered as the `cents` template filter; works on the integer, so no
+    float rounding is involved.
+    """
+    sign = '-' if cents < 0 else ''
+    units, rest = divmod(abs(int(cents)), 100)
+    return f'{sign}{units}.{rest:02d}'
@@ -0,0 +1,214 @@
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select, union, func, or_, and_
+from .models import db, User, Project, Expense, ProjectParticipant, ProjectBalance
+from .money import from_cents
+
+# Read-only query layer: selects only the columns a page or payload shows,
+# through Core statements, and maps them into immutable tuples instead of
+# hydrating ORM instances (no identity map, no change tracking, no lazy loads).
+
+
+class ExpenseRow(namedtuple('ExpenseRow', ['id', 'description', 'amount_cents', 'payer', 'created_at'])):
+    """
+    Read-only view of an open or archived expense.
+
+    Attributes:
+        id (int): Expense ID.
+        description (str): Description of the expense.
+        amount_cents (int): Amount in cents.
+        payer (str): Username of the user who paid.
+        created_at (datetime): Timestamp of when the expense was created.
+    """
+    __slots__ = ()
+
+    @property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'description': self.description,
+            'amount': self.amount,
+            'user': self.payer,
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+class SearchHit(namedtuple('SearchHit', ExpenseRow._fields + ('project_id', 'settlement_id'))):
+    """
+    Read-only view of an expense found by app.search, open or settled.
+
+    Attributes:
+        Those of ExpenseRow, plus:
+        project_id (int): Project the expense belongs to.
+        settlement_id (int): Settlement that archived the expense, None while it is open.
+    """
+    __slots__ = ()
+
+    amount = ExpenseRow.amount
+
+    def to_dict(self):
+        return dict(ExpenseRow.to_dict(self), project_id=self.project_id, settlement_id=self.settlement_id)
+
+
+class ProjectRow(namedtuple('ProjectRow', ['id', 'name', 'creator', 'created_at',
+                                           'expense_count', 'total_cents', 'last_activity'],
+                            defaults=(None, None, None))):
+    """
+    Read-only view of a project in a user's project list.
+
+    Attributes:
+        id (int): Project ID.
+        name (str): Project name.
+        creator (str): Username of the creator.
+        created_at (datetime): Timestamp of when the project was created.
+        expense_count (int): Open expenses, only loaded with stats.
+        total_cents (int): Sum of the open expenses in cents, only loaded with stats.
+        last_activity (datetime): Newest open expense, only loaded with stats.
+    """
+    __slots__ = ()
+
+    def to_dict(self, with_stats=False):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'creator': self.creator,
+            'created_at': self.created_at.isoformat(),
+        }
+        if with_stats:
+            data['expense_count'] = self.expense_count
+            data['total'] = from_cents(self.total_cents)
+            data['last_activity'] = self.last_activity.isoformat() if self.last_activity else None
+        return data
+
+
+def expense_select(model, criterion, *columns):
+    """
+    Select the ExpenseRow columns (plus any extra columns) of Expense or ArchivedExpense rows.
+    """
+    return (
+        select(model.id, model.description, model.amount_cents, User.username, model.created_at, *columns)
+        .join(User, model.user_id == User.id)
+        .where(criterion)
+    )
+
+
+def after_cursor(stmt, model, created_at, expense_id):
+    """
+    Restrict an ascending (created_at, id) statement to rows after a keyset cursor.
+    """
+    return stmt.where(or_(model.created_at > created_at,
+                          and_(model.created_at == created_at, model.id > expense_id)))
+
+
+def encode_cursor(created_at, expense_id):
+    """
+    Encode the (created_at, id) keyset cursor of a page's last expense as an opaque string.
+    """
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{expense_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor, raising ValueError if it is malformed.
+    """
+    try:
+        created_at, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(expense_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+
+
+def to_expense_row(row):
+    return ExpenseRow._make(row[:5])
+
+
+def expense_rows(stmt):
+    """
+    Execute an expense_select statement and return its rows as ExpenseRows.
+    """
+    return [to_expense_row(row) for row in db.session.execute(stmt)]
+
+
+def iter_expense_rows(stmt, batch_size):
+    """
+    Stream an expense_select statement as ExpenseRows, fetching batch_size rows at a time.
+    """
+    for row in db.session.execute(stmt.execution_options(yield_per=batch_size)):
+        yield to_expense_row(row)
+
+
+def project_expenses(project_id, limit=None):
+    """
+    Return the open expenses of a project, newest first, as ExpenseRows.
+    """
+    return expense_rows(expense_select(Expense, Expense.project_id == project_id)
+                        .order_by(Expense.created_at.desc(), Expense.id.desc())
+                        .limit(limit))
+
+
+def user_project_ids(user_id):
+    """
+    Select the IDs of the projects a user created or participates in, as column `project_id`.
+    """
+    # Created and shared project IDs, each side served by its own index.
+    return union(
+        select(Project.id.label('project_id')).where(Project.creator_id == user_id),
+        select(ProjectParticipant.project_id).where(ProjectParticipant.user_id == user_id),
+    ).subquery()
+
+
+def user_projects_select(user_id, with_stats=False):
+    """
+    Select the ProjectRow columns of the projects a user created or participates in, by ID.
+
+    With stats, the expense count and total come from the balance ledger in
+    the same GROUP BY pass and the last activity from a correlated MAX.
+    """
+    project_ids = user_project_ids(user_id)
+
+    columns = [Project.id, Project.name, User.username, Project.created_at]
+    if with_stats:
+        last_activity = (
+            select(func.max(Expense.created_at))
+            .where(Expense.project_id == Project.id)
+            .correlate(Project)
+            .scalar_subquery()
+        )
+        columns += [
+            func.coalesce(func.sum(ProjectBalance.expense_count), 0),
+            func.coalesce(func.sum(ProjectBalance.total_paid_cents), 0),
+            last_activity,
+        ]
+
+    stmt = (
+        select(*columns)
+        .join(project_ids, project_ids.c.project_id == Project.id)
+        .join(User, Project.creator_id == User.id)
+        .order_by(Project.id)
+    )
+    if with_stats:
+        stmt = (
+            stmt.outerjoin(ProjectBalance, ProjectBalance.project_id == Project.id)
+            .group_by(Project.id, Project.name, Project.created_at, User.username)
+        )
+    return stmt
+
+
+def to_project_row(row, with_stats=False):
+    if not with_stats:
+        return ProjectRow(*row)
+    pid, name, creator, created_at, count, total, last = row
+    return ProjectRow(pid, name, creator, created_at, int(count), int(total), last)
+
+
+def user_projects(user_id, with_stats=False):
+    """
+    Load the projects a user created or participates in as ProjectRows, by ID.
+    """
+    rows = db.session.execute(user_projects_select(user_id, with_stats))
+    return [to_project_row(row, with_stats) for row in rows]
@@ -0,0 +1,282 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, update, delete, insert
+from .models import db, User, Project, Expense, ArchivedExpense, Settlement, DailySpend, MonthlySpend
+from .settlement import split_evenly_array
+
+# CLI group registered by create_app: `flask rollups backfill`
+rollups_cli = AppGroup('rollups', help='Maintain the spend rollup tables.')
+
+# Rollup table per granularity accepted by the stats API
+GRANULARITIES = {'day': DailySpend, 'month': MonthlySpend}
+# Rows per executemany batch when backfilling
+BACKFILL_BATCH = 10000
+
+# NumPy is imported by the stats functions that use it: it is the heaviest
+# import of the app and only the stats API needs it, not worker boot.
+
+
+def _buckets(timestamp):
+    day = timestamp.date()
+    return ((DailySpend, day), (MonthlySpend, day.replace(day=1)))
+
+
+def _increment(model, project_id, bucket, user_id, session=db.session, **amounts):
+    result = session.execute(
+        update(model)
+        .where(model.project_id == project_id, model.bucket == bucket, model.user_id == user_id)
+        .values({name: getattr(model, name) + value for name, value in amounts.items()})
+    )
+    if result.rowcount == 0:
+        session.add(model(project_id=project_id, bucket=bucket, user_id=user_id,
+                          **{'paid_cents': 0, 'expense_count': 0, 'settled_cents': 0, **amounts}))
+
+
+def settled_amounts(transfers):
+    """
+    Return the net balance each user cleared through a settlement's transfers.
+
+    Args:
+        transfers (list): Dicts with payer_id, receiver_id and amount_cents, as stored on Settlement.
+
+    Returns:
+        dict: Maps user IDs to cents, positive for users who owed money.
+    """
+    amounts = {}
+    for transfer in transfers:
+        amounts[transfer['payer_id']] = amounts.get(transfer['payer_id'], 0) + transfer['amount_cents']
+        amounts[transfer['receiver_id']] = amounts.get(transfer['receiver_id'], 0) - transfer['amount_cents']
+    return amounts
+
+
+def record_expenses(project_id, expenses, session=db.session):
+    """
+    Add expenses to the daily and monthly rollups of a project.
+
+    Increments are summed per (bucket, user) first, so a bulk import costs
+    one UPDATE per distinct day and month rather than one per expense.
+
+    Args:
+        project_id (int): Project the expenses belong to.
+        expenses (iterable): (user_id, created_at, amount_cents) tuples.
+        session (Session): Session of the caller's transaction.
+    """
+    increments = {}
+    for user_id, created_at, amount_cents in expenses:
+        for model, bucket in _buckets(created_at):
+            total, count = increments.get((model, bucket, user_id), (0, 0))
+            increments[(model, bucket, user_id)] = (total + amount_cents, count + 1)
+    for (model, bucket, user_id), (total, count) in increments.items():
+        _increment(model, project_id, bucket, user_id, session=session, paid_cents=total, expense_count=count)
+
+
+def record_settlement(record):
+    """
+    Add the balances cleared by a settlement to the rollups, on the day it was made.
+
+    The settled expenses themselves stay counted as spending.
+    """
+    for user_id, amount_cents in settled_amounts(record.transfers).items():
+        for model, bucket in _buckets(record.settled_at):
+            _increment(model, record.project_id, bucket, user_id, settled_cents=amount_cents)
+
+
+def backfill(project_id=None, commit=True):
+    """
+    Rebuild the rollups from open and archived expenses and past settlements.
+
+    Returns the number of rollup rows written. With commit=False the work
+    stays in the caller's transaction.
+    """
+    totals = {}
+
+    def add(key, paid=0, count=0, settled=0):
+        old_paid, old_count, old_settled = totals.get(key, (0, 0, 0))
+        totals[key] = (old_paid + paid, old_count + count, old_settled + settled)
+
+    for source in (Expense, ArchivedExpense):
+        stmt = select(source.project_id, source.user_id, source.amount_cents, source.created_at).where(source.created_at.isnot(None))
+        if project_id is not None:
+            stmt = stmt.where(source.project_id == project_id)
+        for pid, user_id, cents, created_at in db.session.execute(stmt.execution_options(yield_per=BACKFILL_BATCH)):
+            for model, bucket in _buckets(created_at):
+                add((model, pid, bucket, user_id), paid=cents, count=1)
+
+    stmt = select(Settlement.project_id, Settlement.settled_at, Settlement.transfers)
+    if project_id is not None:
+        stmt = stmt.where(Settlement.project_id == project_id)
+    for pid, settled_at, transfers in db.session.execute(stmt):
+        for user_id, amount_cents in settled_amounts(transfers).items():
+            for model, bucket in _buckets(settled_at):
+                add((model, pid, bucket, user_id), settled=amount_cents)
+
+    written = 0
+    for model in GRANULARITIES.values():
+        delete_stmt = delete(model)
+        if project_id is not None:
+            delete_stmt = delete_stmt.where(model.project_id == project_id)
+        db.session.execute(delete_stmt)
+        rows = [{'project_id': pid, 'bucket': bucket, 'user_id': user_id,
+                 'paid_cents': paid, 'expense_count': count, 'settled_cents': settled}
+                for (row_model, pid, bucket, user_id), (paid, count, settled) in totals.items() if row_model is model]
+        for start in range(0, len(rows), BACKFILL_BATCH):
+            db.session.execute(insert(model), rows[start:start + BACKFILL_BATCH])
+        written += len(rows)
+    if commit:
+        db.session.commit()
+    return written
+
+
+def _load(model, columns, criterion):
+    """
+    Load rollup columns as one NumPy array each, plus the bucket axis and each row's index on it.
+    """
+    import numpy as np
+
+    rows = db.session.execute(select(model.bucket, *columns).where(criterion)).all()
+    if not rows:
+        return None
+    buckets, *values = zip(*rows)
+    axis, bucket_index = np.unique(np.array(buckets, dtype='datetime64[D]'), return_inverse=True)
+    return axis, bucket_index, [np.array(column, dtype=np.int64) for column in values]
+
+
+def _window(axis, start, end):
+    import numpy as np
+
+    mask = np.ones(len(axis), dtype=bool)
+    if start is not None:
+        mask &= axis >= np.datetime64(start, 'D')
+    if end is not None:
+        mask &= axis <= np.datetime64(end, 'D')
+    return mask
+
+
+def _amounts(cents):
+    import numpy as np
+
+    return np.round(np.asarray(cents) / 100, 2).tolist()
+
+
+def project_stats(project_id, member_ids, granularity='month', start=None, end=None):
+    """
+    Compute the spending statistics of a project from its rollups.
+
+    Rows are scattered into a (user x bucket) matrix, so the work is
+    proportional to the number of buckets and payers, not expenses.
+
+    Args:
+        project_id (int): Project to report on.
+        member_ids (list): Current members, who share every bucket's spend evenly.
+        granularity (str): 'day' or 'month'.
+        start, end (date): Optional inclusive bucket range. Balances still
+            accumulate from the first bucket.
+
+    Returns:
+        dict: `buckets` (ISO dates) with the `spend` and `expense_counts` per
+        bucket, `payers` with each user's total, share of the spend and
+        expense count over the range, and `balances` with each user's running
+        balance per bucket (positive means they owe money). Running balances
+        split past spend among today's members in exact cents, so they match
+        the ledger only while membership is unchanged.
+    """
+    import numpy as np
+
+    model = GRANULARITIES[granularity]
+    loaded = _load(model, (model.user_id, model.paid_cents, model.expense_count, model.settled_cents),
+                   model.project_id == project_id)
+    if loaded is None:
+        return {'granularity': granularity, 'buckets': [], 'spend': [], 'expense_counts': [], 'payers': [], 'balances': []}
+    axis, bucket_index, (user_col, paid_col, count_col, settled_col) = loaded
+
+    members = np.array(sorted(member_ids), dtype=np.int64)
+    user_ids = np.union1d(user_col, members)
+    user_index = np.searchsorted(user_ids, user_col)
+    shape = (len(user_ids), len(axis))
+    paid, counts, settled = np.zeros(shape, np.int64), np.zeros(shape, np.int64), np.zeros(shape, np.int64)
+    np.add.at(paid, (user_index, bucket_index), paid_col)
+    np.add.at(counts, (user_index, bucket_index), count_col)
+    np.add.at(settled, (user_index, bucket_index), settled_col)
+
+    spend = paid.sum(axis=0)
+    share = split_evenly_array(spend, np.isin(user_ids, members))  # Exact cents, columns sum to spend
+    balances = np.cumsum(share - paid - settled, axis=1)
+
+    mask = _window(axis, start, end)
+    paid_in_range = paid[:, mask].sum(axis=1)
+    counts_in_range = counts[:, mask].sum(axis=1)
+    total_in_range = paid_in_range.sum()
+    usernames = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(user_ids.tolist()))).all())
+
+    order = np.argsort(-paid_in_range, kind='stable')
+    return {
+        'granularity': granularity,
+        'buckets': np.datetime_as_string(axis[mask]).tolist(),
+        'spend': _amounts(spend[mask]),
+        'expense_counts': counts.sum(axis=0)[mask].tolist(),
+        'payers': [{'user': usernames.get(int(user_ids[i])), 'paid': _amounts(paid_in_range[i]),
+                    'share': round(float(paid_in_range[i] / total_in_range), 4) if total_in_range else 0.0,
+                    'expense_count': int(counts_in_range[i])}
+                   for i in order if counts_in_range[i]],
+        'balances': [{'user': usernames.get(int(user_id)), 'balance': _amounts(row)}
+                     for user_id, row in zip(user_ids, balances[:, mask])],
+    }
+
+
+def user_stats(user_id, project_ids, granularity='month', start=None, end=None):
+    """
+    Aggregate spending across every project a user belongs to.
+
+    All rollup rows of the projects are loaded once and reduced with
+    NumPy (bincount over bucket and project indexes) instead of per row.
+
+    Args:
+        user_id (int): User whose own payments are reported separately.
+        project_ids: Selectable of the project IDs to include.
+        granularity (str): 'day' or 'month'.
+        start, end (date): Optional inclusive bucket range.
+
+    Returns:
+        dict: `buckets` with the `spend` of all projects and the user's own
+        `paid` per bucket, and `projects` with each project's totals over the range.
+    """
+    import numpy as np
+
+    model = GRANULARITIES[granularity]
+    empty = {'granularity': granularity, 'buckets': [], 'spend': [], 'paid': [], 'projects': []}
+    loaded = _load(model, (model.project_id, model.user_id, model.paid_cents), model.project_id.in_(project_ids))
+    if loaded is None:
+        return empty
+    axis, bucket_index, (project_col, user_col, paid_col) = loaded
+
+    mask = _window(axis, start, end)
+    in_range = mask[bucket_index]
+    if not in_range.any():
+        return empty
+    axis, bucket_index = axis[mask], np.cumsum(mask)[bucket_index[in_range]] - 1
+    project_col, user_col, paid_col = project_col[in_range], user_col[in_range], paid_col[in_range]
+
+    own = user_col == user_id
+    spend = np.bincount(bucket_index, weights=paid_col, minlength=len(axis))
+    paid = np.bincount(bucket_index[own], weights=paid_col[own], minlength=len(axis))
+    projects, project_index = np.unique(project_col, return_inverse=True)
+    project_spend = np.bincount(project_index, weights=paid_col, minlength=len(projects))
+    project_paid = np.bincount(project_index[own], weights=paid_col[own], minlength=len(projects))
+    names = dict(db.session.execute(select(Project.id, Project.name).where(Project.id.in_(projects.tolist()))).all())
+
+    return {
+        'granularity': granularity,
+        'buckets': np.datetime_as_string(axis).tolist(),
+        'spend': _amounts(spend),
+        'paid': _amounts(paid),
+        'projects': [{'id': int(pid), 'name': names.get(int(pid)), 'spend': _amounts(total), 'paid': _amounts(mine)}
+                     for pid, total, mine in zip(projects, project_spend, project_paid)],
+    }
+
+
+@rollups_cli.command('backfill')
+@click.option('--project', 'project_id', type=int, default=None, help='Only rebuild this project.')
+def backfill_command(project_id):
+    """Rebuild the daily and monthly spend rollups from existing data."""
+    written = backfill(project_id)
+    click.echo(f'Rollups rebuilt, {written} row(s) written.')
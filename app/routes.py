@@ -1,13 +1,47 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app, abort, Response, stream_with_context, send_file
 from flask_login import login_user, logout_user, login_required, current_user
-from .forms import RegistrationForm, LoginForm, ProjectForm, ExpenseForm, ShareProjectForm, RemoveParticipantForm, SettleAllForm
-from .models import db, User, Project, Expense, ProjectParticipant
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
-
-# Create a blueprint for the main application routes
+from .models import db, User, Project, Expense, ProjectParticipant, Settlement, ArchivedExpense, Job
+from . import ledger, settlement, importer, membership, rollups, queries, search
+from .cache import cache, project_key, user_key, user_version, bump_versions
+from .jobs import jobs, job_to_dict, export_path
+from .money import to_cents, from_cents, valid_amount
+from werkzeug.http import is_resource_modified
+from sqlalchemy import select, and_, or_
+from datetime import date
+import json
+
+# Create a blueprint for the main application routes.
+# Forms (WTForms) and werkzeug.security are imported inside the views that
+# use them, so worker boot doesn't pay for them before the first request.
 main_bp = Blueprint('main', __name__)
 
+# Page sizes for /api/projects/<id>/expenses
+EXPENSE_PAGE_DEFAULT = 100
+EXPENSE_PAGE_MAX = 1000
+EXPENSE_STREAM_BATCH = 1000
+# Number of past settlements listed on the project page
+RECENT_SETTLEMENTS = 5
+# Projects with more open expenses than this are settled by a background job
+SETTLE_INLINE_MAX = 10000
+# Page sizes for the search APIs
+SEARCH_PAGE_DEFAULT = 50
+SEARCH_PAGE_MAX = 200
+# Most recent open expenses listed on the project page; older ones are reached by search
+PROJECT_PAGE_EXPENSES = 200
+# Header every API write must carry. Browsers only send custom headers cross-site
+# after a CORS preflight, which this app never approves, so a forged <form> post
+# to a cookie-authenticated API is refused.
+API_WRITE_HEADER = 'X-Requested-With'
+
+@main_bp.before_request
+def _require_api_write_header():
+    """
+    Refuse API writes without API_WRITE_HEADER; the form views check their CSRF tokens instead.
+    """
+    if request.path.startswith('/api/') and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and not request.headers.get(API_WRITE_HEADER):
+        abort(403, description=f'API writes must send the {API_WRITE_HEADER} header.')
+
 @main_bp.route('/')
 @login_required
 def index():
@@ -16,9 +50,7 @@ def index():
 
     This includes projects created by the user and projects shared with them.
     """
-    projects_created = current_user.projects_created
-    projects_participating = [pp.project for pp in current_user.projects_shared]
-    projects = projects_created + projects_participating
+    projects = cache.get_or_set(user_key(current_user, 'projects', 'plain'), lambda: queries.user_projects(current_user.id))
     return render_template('index.html', projects=projects)
 
 @main_bp.route('/register', methods=['GET', 'POST'])
@@ -32,6 +64,8 @@ def register():
     """
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
+    from .forms import RegistrationForm
+    from werkzeug.security import generate_password_hash
     form = RegistrationForm()
     if form.validate_on_submit():
         hashed_password = generate_password_hash(form.password.data, method='pbkdf2:sha256', salt_length=8) #Added salt and sha256
@@ -53,6 +87,8 @@ def login():
     """
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
+    from .forms import LoginForm
+    from werkzeug.security import check_password_hash
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
@@ -84,53 +120,510 @@ def create_project():
     On POST, validate the project form, create a new project,
     and redirect to the index page.
     """
+    from .forms import ProjectForm
     form = ProjectForm()
     if form.validate_on_submit():
         new_project = Project(name=form.name.data, creator=current_user)
         db.session.add(new_project)
+        db.session.flush()  # Assigns new_project.id for the ledger row
+        ledger.add_participant(new_project.id, current_user.id)
+        bump_versions(new_project.id)
         db.session.commit()
         flash('Project created successfully!', 'success')
         return redirect(url_for('main.index'))
     return render_template('create_project.html', form=form)
 
 @main_bp.route('/api/projects')
+@login_required
 def api_projects():
     """
     Returns a JSON list of projects the current user has access to.
-    """
-    projects = Project.query.all()
 
-    project_list = []
-    for project in projects:
-        project_data = {
-            'id': project.id,
-            'name': project.name,
-            'creator': project.creator.username,
-            'created_at': project.created_at.isoformat(),
-        }
-        project_list.append(project_data)
+    Covers projects the user created and projects shared with them, loaded
+    together with their creators in a single query. With `stats=1` each
+    project also carries its expense count, total and last activity, taken
+    from the balance ledger in the same GROUP BY pass.
 
-    return jsonify(project_list)
+    Supports conditional GET: the ETag follows the user's version, so an
+    unchanged list is answered with 304 before anything is loaded.
+    """
+    with_stats = request.args.get('stats') == '1'
+    version = user_version(current_user.id)
+    etag = f'user-{current_user.id}-v{version}'
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    key = user_key(current_user, 'projects', 'stats' if with_stats else 'plain', version=version)
+    projects = cache.get_or_set(key, lambda: queries.user_projects(current_user.id, with_stats))
+    return _with_validators(jsonify([project.to_dict(with_stats) for project in projects]), etag)
 
 @main_bp.route('/api/projects/<int:project_id>/expenses')
+@login_required
 def api_project_expenses(project_id):
     """
-    Returns a JSON list of expenses for a specific project.
+    Returns the open expenses of a specific project, oldest first.
+
+    Pages are cut with a keyset cursor on (created_at, id): pass `limit`
+    (default 100, max 1000) and the `next` cursor of the previous page as
+    `after`. With `stream=1` every expense after the cursor is streamed as
+    newline-delimited JSON at constant memory instead.
+
+    Supports conditional GET through the project's ETag and Last-Modified.
     """
     project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    etag, last_modified = _project_validators(project)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+    return _with_validators(_expense_listing(Expense, Expense.project_id == project_id, project_key(project, 'expenses')),
+                            etag, last_modified)
+
+@main_bp.route('/api/projects/<int:project_id>/stats')
+@login_required
+def api_project_stats(project_id):
+    """
+    Returns spend over time, per-payer shares and running balances of a project.
 
-    expense_list = []
-    for expense in project.expenses:
-        expense_data = {
-            'id': expense.id,
-            'description': expense.description,
-            'amount': expense.amount,
-            'user': expense.user.username,
-            'created_at': expense.created_at.isoformat(),
-        }
-        expense_list.append(expense_data)
+    Served from the daily or monthly rollups (`granularity=day|month`,
+    default month), optionally limited to buckets between `from` and `to`
+    (ISO dates). See app.rollups.project_stats for the payload.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    granularity, start, end = _stats_args()
+    etag, last_modified = _project_validators(project)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+    key = project_key(project, 'stats', granularity, start, end)
+    member_ids = list(membership.member_ids(project))
+    return _with_validators(jsonify(cache.get_or_set(
+        key, lambda: rollups.project_stats(project.id, member_ids, granularity, start, end))), etag, last_modified)
+
+@main_bp.route('/api/stats')
+@login_required
+def api_stats():
+    """
+    Returns spending across every project of the current user.
 
-    return jsonify(expense_list)
+    Takes the same `granularity`, `from` and `to` arguments as the project
+    stats. See app.rollups.user_stats for the payload.
+    """
+    granularity, start, end = _stats_args()
+    version = user_version(current_user.id)
+    etag = f'user-{current_user.id}-v{version}'
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    key = user_key(current_user, 'stats', granularity, start, end, version=version)
+    user_id = current_user.id
+    return _with_validators(jsonify(cache.get_or_set(
+        key, lambda: rollups.user_stats(user_id, select(queries.user_project_ids(user_id).c.project_id), granularity, start, end))), etag)
+
+def _stats_args():
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in rollups.GRANULARITIES:
+        abort(400, description=f'granularity must be one of {", ".join(rollups.GRANULARITIES)}.')
+    return (granularity, *_date_range_args())
+
+def _date_range_args():
+    try:
+        return tuple(date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                     for name in ('from', 'to'))
+    except ValueError:
+        abort(400, description='from and to must be ISO dates.')
+
+def _amount_range_args():
+    try:
+        amounts = tuple(float(request.args[name]) if request.args.get(name) else None for name in ('min', 'max'))
+    except ValueError:
+        abort(400, description='min and max must be numbers.')
+    if not all(amount is None or valid_amount(amount) for amount in amounts):
+        abort(400, description='min and max must be finite amounts within range.')
+    return amounts
+
+@main_bp.route('/api/projects/<int:project_id>/search')
+@login_required
+def api_project_search(project_id):
+    """
+    Searches the open and settled expenses of a project, newest first.
+
+    Arguments, all optional: `q` (words that must all prefix-match the
+    description), `payer` (username), `min` and `max` (amount), `from` and
+    `to` (ISO dates), plus `limit` (default 50, max 200) and the `next`
+    cursor of the previous page as `after`. Filters are served by the
+    composite expense indexes and `q` by the full-text index; `q` answers
+    501 on databases without one.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    etag, last_modified = _project_validators(project)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+    return _with_validators(_search_response([project.id]), etag, last_modified)
+
+@main_bp.route('/api/search')
+@login_required
+def api_search():
+    """
+    Searches the expenses of every project of the current user.
+
+    Takes the same arguments as the project search; each result carries its `project_id`.
+    """
+    etag = f'user-{current_user.id}-v{user_version(current_user.id)}'
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    project_ids = db.session.scalars(select(queries.user_project_ids(current_user.id).c.project_id)).all()
+    return _with_validators(_search_response(project_ids), etag)
+
+def _search_response(project_ids):
+    query = request.args.get('q', '').strip() or None
+    if query and not search.supported():
+        abort(501, description='Full-text search is not available on this database.')
+    payer = request.args.get('payer')
+    payer_ids = db.session.scalars(select(User.id).where(User.username == payer)).all() if payer else None
+    min_amount, max_amount = _amount_range_args()
+    start, end = _date_range_args()
+    after = request.args.get('after')
+    try:
+        cursor = queries.decode_cursor(after) if after else None
+    except ValueError:
+        abort(400, description='Invalid cursor.')
+    limit = min(request.args.get('limit', SEARCH_PAGE_DEFAULT, type=int), SEARCH_PAGE_MAX)
+    if limit < 1:
+        abort(400, description='limit must be positive.')
+
+    hits = search.search(project_ids, query, payer_ids, min_amount=min_amount, max_amount=max_amount,
+                         start=start, end=end, after=cursor, limit=limit + 1)
+    page = hits[:limit]
+    next_cursor = queries.encode_cursor(page[-1].created_at, page[-1].id) if len(hits) > limit else None
+    return jsonify({'results': [hit.to_dict() for hit in page], 'next': next_cursor})
+
+@main_bp.route('/api/projects/<int:project_id>/changes')
+@login_required
+def api_project_changes(project_id):
+    """
+    Returns what changed in a project since a change sequence, for polling clients.
+
+    `since` is the `seq` of the client's last sync (0 for a first sync). The
+    response carries the `seq` to sync from next, at most `limit` (default
+    100, max 1000) open expenses added after `since` (in sequence order)
+    and, under `deleted`, the IDs of expenses the client has seen that were
+    since removed by a settlement. When the page is full, `seq` is that of
+    its last expense and `after` its ID; pass both back (as `since` and
+    `after`) until `after` is null, at which point `seq` is the current one.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        abort(400, description='since must be a non-negative change sequence.')
+    if since > project.version:
+        abort(400, description='since is ahead of the project; sync again from 0.')
+    after = request.args.get('after', type=int)
+    if after is not None and after < 0:
+        abort(400, description='after must be an expense ID.')
+    limit = min(request.args.get('limit', EXPENSE_PAGE_DEFAULT, type=int), EXPENSE_PAGE_MAX)
+    if limit < 1:
+        abort(400, description='limit must be positive.')
+
+    etag, last_modified = _project_validators(project)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+    return _with_validators(jsonify(cache.get_or_set(project_key(project, 'changes', since, after, limit),
+                                                     lambda: _project_changes(project, since, after, limit))),
+                            etag, last_modified)
+
+def _project_changes(project, since, after, limit):
+    """
+    Collect up to `limit` expenses added and the tombstones written after a change sequence.
+
+    Imports stamp a whole chunk with one sequence, so pages are cut on
+    (seq, id) and `after` continues within the `since` sequence.
+    """
+    position = Expense.seq > since
+    if after is not None:
+        position = or_(position, and_(Expense.seq == since, Expense.id > after))
+    rows = db.session.execute(
+        queries.expense_select(Expense, and_(Expense.project_id == project.id, position), Expense.seq)
+        .order_by(Expense.seq, Expense.id)
+        .limit(limit + 1)  # One extra row tells us whether there is a next page
+    ).all()
+    added = rows[:limit]
+    # Expenses both added and settled after `since` were never seen by the client and need no tombstone.
+    deleted = db.session.scalars(
+        select(ArchivedExpense.id)
+        .join(Settlement, ArchivedExpense.settlement_id == Settlement.id)
+        .where(Settlement.project_id == project.id, Settlement.seq > since, ArchivedExpense.seq <= since)
+        .order_by(ArchivedExpense.id)
+    )
+    more = len(rows) > limit
+    return {
+        'seq': added[-1].seq if more else project.version,
+        'after': added[-1].id if more else None,
+        'expenses': [dict(queries.to_expense_row(row).to_dict(), seq=row.seq) for row in added],
+        'deleted': list(deleted),
+    }
+
+@main_bp.route('/api/projects/<int:project_id>/settlements')
+@login_required
+def api_project_settlements(project_id):
+    """
+    Returns the past settlements of a project, newest first.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    etag, last_modified = _project_validators(project)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+    return _with_validators(jsonify(cache.get_or_set(project_key(project, 'settlements'), lambda: _settlement_history(project))),
+                            etag, last_modified)
+
+def _settlement_history(project):
+    """
+    Serialize every past settlement of a project, resolving usernames in one query.
+    """
+    settlements = Settlement.query.filter_by(project_id=project.id).order_by(Settlement.id.desc()).all()
+    user_ids = {project.creator_id}
+    for record in settlements:
+        user_ids.update(entry['user_id'] for entry in record.totals)
+        for transfer in record.transfers:
+            user_ids.update((transfer['payer_id'], transfer['receiver_id']))
+    usernames = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all())
+
+    return [{
+        'id': record.id,
+        'settled_at': record.settled_at.isoformat(),
+        'settled_by': usernames.get(record.settled_by_id),
+        'expense_count': record.expense_count,
+        'total': from_cents(record.total_cents),
+        'totals': [{'user': usernames.get(entry['user_id']), 'paid': from_cents(entry['paid_cents']),
+                    'expense_count': entry['expense_count']} for entry in record.totals],
+        'transfers': [{'payer': usernames.get(t['payer_id']), 'receiver': usernames.get(t['receiver_id']),
+                       'amount': from_cents(t['amount_cents'])} for t in record.transfers],
+    } for record in settlements]
+
+@main_bp.route('/api/projects/<int:project_id>/settlements/<int:settlement_id>/expenses')
+@login_required
+def api_settlement_expenses(project_id, settlement_id):
+    """
+    Returns the archived expenses of a past settlement, oldest first.
+
+    Takes the same `limit`, `after` and `stream` arguments as the open
+    expense listing, served from the archive table. Settled expenses never
+    change, so the ETag is fixed per settlement.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    record = Settlement.query.filter_by(id=settlement_id, project_id=project_id).first_or_404()
+    etag = f'settlement-{record.id}'
+    not_modified = _not_modified(etag, record.settled_at)
+    if not_modified:
+        return not_modified
+    return _with_validators(_expense_listing(ArchivedExpense, ArchivedExpense.settlement_id == settlement_id,
+                                             project_key(project, 'settlement', settlement_id, 'expenses')),
+                            etag, record.settled_at)
+
+@main_bp.route('/api/projects/<int:project_id>/import', methods=['POST'])
+@login_required
+def api_import_expenses(project_id):
+    """
+    Bulk-import expenses into a project from a CSV or NDJSON upload.
+
+    The file is sent as the `file` field of a multipart form or as the raw
+    request body. The format is taken from the `format` argument (`csv` or
+    `ndjson`), falling back to the file name or content type. Returns a
+    report with per-row errors and throughput; see app.importer.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    filename = upload.filename if upload else ''
+    content_type = upload.mimetype if upload else request.mimetype
+
+    fmt = request.args.get('format')
+    if not fmt:
+        if filename.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+            fmt = 'ndjson'
+        elif filename.endswith('.csv') or content_type == 'text/csv':
+            fmt = 'csv'
+    if fmt == 'csv':
+        rows = importer.iter_csv_rows(stream)
+    elif fmt == 'ndjson':
+        rows = importer.iter_ndjson_rows(stream)
+    else:
+        abort(400, description='Unknown import format, pass format=csv or format=ndjson.')
+
+    chunk_size = request.args.get('chunk_size', current_app.config.get('IMPORT_CHUNK_SIZE', importer.DEFAULT_CHUNK_SIZE), type=int)
+    if chunk_size < 1:
+        abort(400, description='chunk_size must be positive.')
+    report = importer.import_expenses(project, rows, current_user.id, chunk_size=chunk_size,
+                                      max_errors=current_app.config.get('IMPORT_MAX_ERRORS', importer.DEFAULT_MAX_ERRORS))
+    return jsonify(report.to_dict())
+
+@main_bp.route('/api/projects/<int:project_id>/settle', methods=['POST'])
+@login_required
+def api_settle_project(project_id):
+    """
+    Settle a project in the background. Only the creator may do this.
+
+    Returns 202 with the job and its status URL in Location; see api_job.
+    """
+    project = Project.query.get_or_404(project_id)
+    if current_user.id != project.creator_id:
+        abort(403)
+    return _enqueue_job('settle', project)
+
+@main_bp.route('/api/projects/<int:project_id>/recompute', methods=['POST'])
+@login_required
+def api_recompute_project(project_id):
+    """
+    Rebuild a project's ledger and rollups in the background. Only the creator may do this.
+    """
+    project = Project.query.get_or_404(project_id)
+    if current_user.id != project.creator_id:
+        abort(403)
+    return _enqueue_job('recompute', project)
+
+@main_bp.route('/api/projects/<int:project_id>/export', methods=['POST'])
+@login_required
+def api_export_project(project_id):
+    """
+    Export every open and settled expense of a project as NDJSON, in the background.
+
+    Once the job is done the file is served by api_job_download.
+    """
+    project = Project.query.get_or_404(project_id)
+    if not membership.is_member(project, current_user.id):
+        abort(403)
+    return _enqueue_job('export', project)
+
+def _enqueue_job(kind, project):
+    """
+    Queue a job for a project and answer 202, or 409 if another kind of job is active.
+
+    Repeating a request while the same kind of job is active returns that job.
+    """
+    job, created = jobs.enqueue(kind, project.id, current_user.id)
+    if not created and job.kind != kind:
+        return jsonify({'error': 'Another job is active on this project.', 'job': job_to_dict(job)}), 409
+    return jsonify(job_to_dict(job)), 202, {'Location': url_for('main.api_job', job_id=job.id)}
+
+@main_bp.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job(job_id):
+    """
+    Returns the status, progress and result of a background job.
+
+    Visible to the user who started it and to members of its project.
+    """
+    return jsonify(job_to_dict(_get_job(job_id)))
+
+@main_bp.route('/api/jobs/<int:job_id>/download')
+@login_required
+def api_job_download(job_id):
+    """
+    Download the file written by a finished export job.
+
+    Answers 410 when the file is gone (cleaned up, or written on another host).
+    """
+    job = _get_job(job_id)
+    if job.kind != 'export' or job.status != 'done':
+        abort(404)
+    try:
+        return send_file(export_path(job), mimetype='application/x-ndjson', as_attachment=True,
+                         download_name=job.result['file'])
+    except FileNotFoundError:
+        abort(410, description='The export file is no longer available; run the export again.')
+
+def _get_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.user_id != current_user.id and not membership.user_can_access(job.project_id, current_user.id):
+        abort(404)  # Don't reveal other projects' jobs
+    return job
+
+@main_bp.route('/api/cache/stats')
+@login_required
+def api_cache_stats():
+    """
+    Returns the hit, miss and eviction counters and size of the cache backend.
+    """
+    return jsonify(cache.stats())
+
+def _expense_listing(model, criterion, cache_prefix):
+    """
+    Build a keyset-paginated or streamed JSON response over Expense or ArchivedExpense rows.
+
+    Pages are cached under cache_prefix plus the cursor and limit; streams are not cached.
+    """
+    after = request.args.get('after')
+    try:
+        cursor = queries.decode_cursor(after) if after else None
+    except ValueError:
+        abort(400, description='Invalid cursor.')
+
+    stmt = queries.expense_select(model, criterion).order_by(model.created_at, model.id)
+    if cursor:
+        stmt = queries.after_cursor(stmt, model, *cursor)
+
+    if request.args.get('stream') == '1':
+        def generate():
+            for expense in queries.iter_expense_rows(stmt, EXPENSE_STREAM_BATCH):
+                yield json.dumps(expense.to_dict()) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = min(request.args.get('limit', EXPENSE_PAGE_DEFAULT, type=int), EXPENSE_PAGE_MAX)
+    if limit < 1:
+        abort(400, description='limit must be positive.')
+
+    def build_page():
+        rows = queries.expense_rows(stmt.limit(limit + 1))  # One extra row tells us whether there is a next page
+        page = rows[:limit]
+        next_cursor = queries.encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+        return {'expenses': [expense.to_dict() for expense in page], 'next': next_cursor}
+
+    return jsonify(cache.get_or_set(f'{cache_prefix}:{after}:{limit}', build_page))
+
+def _project_validators(project):
+    """
+    Return the (ETag, Last-Modified) pair of a project's API resources.
+
+    Both follow Project.version / updated_at, which every write bumps.
+    """
+    return f'project-{project.id}-v{project.version}', project.updated_at
+
+def _not_modified(etag, last_modified=None):
+    """
+    Return a 304 response if the client's cached copy is current, else None.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _with_validators(Response(status=304), etag, last_modified)
+
+def _with_validators(response, etag, last_modified=None):
+    """
+    Attach the validators to a response and make clients revalidate before reuse.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True  # Payloads depend on the logged-in user's access
+    response.cache_control.no_cache = True
+    return response
 
 @main_bp.route('/project/<int:project_id>/settle', methods=['POST'])
 @login_required
@@ -139,19 +632,32 @@ def settle_project(project_id):
     Handle settling all expenses for a project.
 
     Only the project creator can perform this action.
-    This deletes all expenses associated with the project.
+    This moves all open expenses of the project to the settlement archive.
     """
     project = Project.query.get_or_404(project_id)
 
     # Only the project creator can settle
-    if current_user != project.creator:
+    if current_user.id != project.creator_id:
         flash('You do not have permission to settle this project.', 'danger')
         return redirect(url_for('main.project', project_id=project_id))
 
-    # Delete all expenses associated with the project
-    expenses_to_settle = Expense.query.filter_by(project_id=project_id).all()
-    for expense in expenses_to_settle:
-        db.session.delete(expense)
+    # Large projects are settled in the background so the worker isn't blocked
+    open_expenses = sum(count for _, count in ledger.get_balances(project_id).values())
+    if open_expenses > current_app.config.get('SETTLE_INLINE_MAX', SETTLE_INLINE_MAX):
+        job, created = jobs.enqueue('settle', project_id, current_user.id)
+        if created or job.kind == 'settle':
+            flash('The settlement is running in the background and will show up here when it is done.', 'info')
+        else:
+            flash('Another operation is running on this project, please try again shortly.', 'warning')
+        return redirect(url_for('main.project', project_id=project_id))
+
+    # Archive all open expenses of the project in one set-based transaction
+    record = ledger.settle_project(project, current_user.id,
+                                   exact=current_app.config.get('SETTLEMENT_EXACT', True))
+    if record is None:
+        db.session.rollback()  # Undo the version bump
+        flash('There are no expenses to settle.', 'info')
+        return redirect(url_for('main.project', project_id=project_id))
     db.session.commit()
 
     flash('All expenses for this project have been settled!', 'success')
@@ -171,10 +677,12 @@ def project(project_id):
     project = Project.query.get_or_404(project_id)
 
     # Check if the user has access to the project
-    if current_user != project.creator and current_user not in [p.user for p in project.participants]:
+    if not membership.is_member(project, current_user.id):
         flash('You do not have access to this project.', 'danger')
         return redirect(url_for('main.index'))
 
+    from .forms import ExpenseForm, ShareProjectForm, RemoveParticipantForm, SettleAllForm
+
     # Use prefixes for the forms!  This is essential for multiple forms.
     expense_form = ExpenseForm(prefix='expense')
     share_form = ShareProjectForm(prefix='share')
@@ -183,17 +691,13 @@ def project(project_id):
 
 
     # --- Populate choices for the dropdown ---
-    participants = [project.creator] + [p.user for p in project.participants]
-    participant_choices = [(user.id, user.username) for user in participants if user.id != project.creator.id] # Exclude creator
+    participant_choices = [(user_id, username) for user_id, username in membership.members(project) if user_id != project.creator_id] # Exclude creator
 
     remove_participant_form.user_id.choices = participant_choices
 
     if expense_form.is_submitted() and expense_form.validate():
-        new_expense = Expense(description=expense_form.description.data,
-                              amount=expense_form.amount.data,
-                              user=current_user,
-                              project=project)
-        db.session.add(new_expense)
+        ledger.add_expense(project.id, current_user.id, expense_form.description.data,
+                           to_cents(expense_form.amount.data))
         db.session.commit()
         flash('Expense added successfully!', 'success')
         return redirect(url_for('main.project', project_id=project_id))
@@ -201,13 +705,16 @@ def project(project_id):
     if share_form.is_submitted() and share_form.validate():
         user_to_share = User.query.filter_by(email=share_form.email.data).first()
         if user_to_share:
-            if user_to_share == project.creator:
+            if user_to_share.id == project.creator_id:
                 flash('Cannot share the project with the owner.', 'warning')
-            elif any(participant_user_id == user_to_share.id for participant_user_id in [p.user_id for p in project.participants]):
+            elif user_to_share.id in membership.member_ids(project):
                 flash('This user is already a participant in this project.', 'warning')
             else:
+                # Bump first: it locks the project row before the ledger row, as every write does
+                bump_versions(project.id, [user_to_share.id])
                 project_participant = ProjectParticipant(project_id=project.id, user_id=user_to_share.id)
                 db.session.add(project_participant)
+                ledger.add_participant(project.id, user_to_share.id)
                 db.session.commit()
                 flash('Project shared successfully!', 'success')
         else:
@@ -221,7 +728,9 @@ def project(project_id):
             return redirect(url_for('main.project', project_id=project_id))  # Redirect if trying to remove creator
         participant_to_remove = ProjectParticipant.query.filter_by(project_id=project_id, user_id=user_id_to_remove).first()
         if participant_to_remove:
+            bump_versions(project_id, [user_id_to_remove])  # Project row lock before the ledger row
             db.session.delete(participant_to_remove)
+            ledger.remove_participant(project_id, user_id_to_remove)
             db.session.commit()
             flash('Participant removed successfully!', 'success')
         else:
@@ -229,38 +738,52 @@ def project(project_id):
         return redirect(url_for('main.project', project_id=project_id))  # IMPORTANT: Redirect after processing!
 
 
-    # --- Debt Calculation Logic ---
-    total_spent = db.session.query(func.sum(Expense.amount)).filter(Expense.project_id == project_id).scalar() or 0
-    total_spent = round(total_spent, 2)
-    expenses = Expense.query.filter_by(project_id=project_id).order_by(Expense.created_at.desc()).all()
-    all_participants = [project.creator] + [p.user for p in project.participants]
-    num_participants = len(all_participants)
-    split_amount = total_spent / num_participants if num_participants > 0 else 0
-
-    balances = {}
-    for user in all_participants:
-        user_spent = db.session.query(func.sum(Expense.amount)).filter(Expense.project_id == project_id, Expense.user_id == user.id).scalar() or 0
-        balances[user.username] = split_amount - user_spent
-
-    debts = []
-    receivers = {user: balance for user, balance in balances.items() if balance < 0}
-    payers = {user: balance for user, balance in balances.items() if balance > 0}
-
-    for payer, pay_amount in payers.items():
-        for receiver, receive_amount in receivers.items():
-            if pay_amount <= 0:  # Optimization: Skip if payer has paid all debts
-                break
-            if receive_amount >= 0: # Optimization: Skip if receiver is fully paid
-                continue
-
-            amount_to_transfer = min(pay_amount, -receive_amount)
-            debts.append({'payer': payer, 'receiver': receiver, 'amount': amount_to_transfer})
-            pay_amount -= amount_to_transfer
-            receivers[receiver] += amount_to_transfer  # Update the receiver's balance
-
-    return render_template('project.html', project=project, expenses=expenses,
+    query = request.args.get('q', '').strip()
+    if query and search.supported():
+        expenses = search.search([project_id], query, limit=PROJECT_PAGE_EXPENSES, settled=False)  # The list shows open expenses
+    else:
+        expenses = queries.project_expenses(project_id, limit=PROJECT_PAGE_EXPENSES)  # ExpenseRows, no ORM hydration
+    summary = cache.get_or_set(project_key(project, 'totals'), lambda: _project_summary(project))
+
+    creator_name = membership.members(project)[0][1]  # Members list puts the creator first
+    return render_template('project.html', project=project, creator_name=creator_name, expenses=expenses, query=query,
                            expense_form=expense_form, share_form=share_form,
-                           total_spent=total_spent, split_amount=split_amount,
-                           debts=debts, # Pass debts to the template
+                           total_cents=summary['total_cents'], share_cents=summary['share_cents'],
+                           extra_cent_shares=summary['extra_cent_shares'],
+                           debts=summary['debts'], # Pass debts to the template
+                           settlements=summary['settlements'],
                            remove_participant_form=remove_participant_form,
-                           settle_all_form = settle_all_form) # Pass the form
\ No newline at end of file
+                           settle_all_form = settle_all_form) # Pass the form
+
+def _project_summary(project):
+    """
+    Compute the totals, debts and recent settlements shown on the project page.
+    """
+    # --- Debt Calculation Logic ---
+    # Totals come from the materialized ledger (one indexed lookup) rather than SUMs over expense.
+    # All amounts stay integer cents; the template formats them with the `cents` filter.
+    paid = ledger.get_balances(project.id)
+    total_cents = sum(total for total, _ in paid.values())
+    all_participants = membership.members(project)
+    # Shares differ by at most one cent; the first extra_cent_shares members pay share_cents + 1.
+    share_cents, extra_cent_shares = divmod(total_cents, len(all_participants)) if all_participants else (0, 0)
+
+    # Users who paid but have since been removed get no share and are paid back.
+    usernames = dict(all_participants)
+    former_payers = [user_id for user_id in paid if user_id not in usernames]
+    if former_payers:
+        usernames.update(db.session.execute(select(User.id, User.username).where(User.id.in_(former_payers))).all())
+
+    balances = settlement.net_balances({user_id: total for user_id, (total, _) in paid.items()},
+                                       [user_id for user_id, _ in all_participants])
+    transfers = settlement.settle(balances, exact=current_app.config.get('SETTLEMENT_EXACT', True))
+    debts = [{'payer': usernames[t.payer], 'receiver': usernames[t.receiver],
+              'amount_cents': t.amount_cents} for t in transfers]
+
+    # Settled expenses live in the archive; only the settlement summaries are shown here.
+    settlements = [
+        {'settled_at': record.settled_at, 'total_cents': record.total_cents, 'expense_count': record.expense_count}
+        for record in Settlement.query.filter_by(project_id=project.id).order_by(Settlement.id.desc()).limit(RECENT_SETTLEMENTS)
+    ]
+    return {'total_cents': total_cents, 'share_cents': share_cents, 'extra_cent_shares': extra_cent_shares,
+            'debts': debts, 'settlements': settlements}
\ No newline at end of file
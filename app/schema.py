@@ -0,0 +1,240 @@
+import logging
+from datetime import datetime
+import click
+from flask import current_app, abort
+from flask.cli import AppGroup
+from sqlalchemy import select, update, inspect, bindparam, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateColumn
+from .models import db, Expense, ArchivedExpense, SchemaVersion
+from .money import to_cents
+
+logger = logging.getLogger(__name__)
+
+# CLI group registered by create_app: `flask schema migrate`, `flask schema status`
+schema_cli = AppGroup('schema', help='Inspect and migrate the database schema.')
+
+# Version of the schema defined by app.models; bump it with every model change
+SCHEMA_VERSION = 3
+# Boot modes accepted by BOOT_MODE
+BOOT_MODES = ('development', 'production')
+# Rows per batch (and commit) in data migrations
+MIGRATION_BATCH = 10000
+
+# Data migrations by the schema version that introduced them, filled by @data_migration
+DATA_MIGRATIONS = {}
+
+
+def data_migration(version):
+    """
+    Register a function that migrates existing data to a schema version.
+
+    migrate() runs it once the tables, columns and indexes of the models
+    exist, for databases stored at an older version, in version order.
+    """
+    def register(func):
+        DATA_MIGRATIONS[version] = func
+        return func
+    return register
+
+
+def current_version():
+    """
+    Return the schema version stored in the database, in one query.
+
+    Returns None when the database was never migrated.
+    """
+    try:
+        return db.session.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1)).scalar()
+    except (OperationalError, ProgrammingError):  # No schema_version table yet
+        db.session.rollback()
+        return None
+
+
+def migrate():
+    """
+    Bring the database up to the models and record SCHEMA_VERSION.
+
+    Creates missing tables, adds missing columns and indexes to existing
+    ones, sets up the full-text search index and runs the data migrations
+    of newer versions. Databases that never recorded a version also get
+    their ledger and rollups rebuilt. Added columns must be nullable or
+    have a server default. Constraints of existing tables are not changed.
+
+    Returns:
+        list: Descriptions of the changes made.
+    """
+    from .search import ensure_index
+
+    stored = current_version()
+    engine = db.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    db.create_all()
+    changes = [f'created table {name}' for name in sorted(set(db.metadata.tables) - existing)]
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                    changes.append(f'added column {table.name}.{column.name}')
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f'created index {index.name}')
+
+    for version, func in sorted(DATA_MIGRATIONS.items()):
+        if stored is None or stored < version:
+            func()
+            changes.append(f'migrated data to version {version} ({func.__name__})')
+
+    if stored is None and 'expense' in existing:
+        # Tables from before schema versioning may hold expenses the balance
+        # ledger and the spend rollups never saw; derive both from the expenses.
+        from .ledger import rebuild_ledger
+        from .rollups import backfill
+        drift = rebuild_ledger()
+        backfill()
+        changes.append(f'rebuilt the balance ledger ({len(drift)} row(s) corrected) and the spend rollups')
+
+    ensure_index()
+    db.session.merge(SchemaVersion(id=1, version=SCHEMA_VERSION, migrated_at=datetime.utcnow()))
+    db.session.commit()
+    return changes
+
+
+@data_migration(2)
+def backfill_amount_cents():
+    """
+    Fill amount_cents of open and archived expenses from the float amount.
+
+    Each amount is rounded with to_cents, as the ledger and rollups always
+    were, so the stored cents agree with them. The (project_id, amount)
+    indexes replaced by the amount_cents ones are dropped.
+    """
+    for model in (Expense, ArchivedExpense):
+        table = model.__table__
+        fill = update(table).where(table.c.id == bindparam('row_id')).values(amount_cents=bindparam('cents'))
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, table.c.amount).where(table.c.amount_cents.is_(None)).limit(MIGRATION_BATCH)
+            ).all()
+            if not rows:
+                break
+            db.session.execute(fill, [{'row_id': row_id, 'cents': to_cents(amount)} for row_id, amount in rows])
+            db.session.commit()
+
+    inspector = inspect(db.engine)
+    for table_name in ('expense', 'archived_expense'):
+        index_name = f'ix_{table_name}_project_amount'
+        if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+            on_table = f' ON {table_name}' if db.engine.dialect.name == 'mysql' else ''
+            db.session.execute(text(f'DROP INDEX {index_name}{on_table}'))
+    db.session.commit()
+
+
+@data_migration(3)
+def sqlite_expense_autoincrement():
+    """
+    Rebuild a SQLite expense table created without AUTOINCREMENT.
+
+    Archived expenses keep their ID and their full-text index row, so open
+    expenses must never reuse an ID; plain rowid tables hand out max(id) + 1
+    again once the newest expenses were settled. The table is recreated from
+    the model and its sequence starts after the largest ID of both tables.
+    The full-text triggers go with the old table; migrate() recreates them.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    table = Expense.__table__
+    ddl = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {'name': table.name}).scalar()
+    db.session.commit()
+    if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+        return
+
+    columns = ', '.join(column.name for column in table.columns)
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')  # Only takes effect outside a transaction
+        connection.commit()
+        try:
+            with connection.begin():
+                connection.exec_driver_sql('BEGIN')  # pysqlite doesn't open transactions for DDL by itself
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {table.name}_old')
+                old_indexes = connection.exec_driver_sql(
+                    f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '{table.name}_old' "
+                    "AND sql IS NOT NULL").scalars().all()
+                for name in old_indexes:
+                    connection.exec_driver_sql(f'DROP INDEX {name}')  # Renamed along with the table
+                table.create(connection)  # With its indexes
+                connection.exec_driver_sql(
+                    f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old')
+                connection.exec_driver_sql(f'DROP TABLE {table.name}_old')
+                connection.exec_driver_sql(
+                    f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table.name}', 0 "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table.name}')")
+                connection.exec_driver_sql(
+                    f"UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT COALESCE(MAX(id), 0) FROM {table.name}), "
+                    f"(SELECT COALESCE(MAX(id), 0) FROM {ArchivedExpense.__table__.name})) WHERE name = '{table.name}'")
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+            connection.commit()
+
+
+def init_app(app):
+    """
+    Prepare the schema for an app according to its BOOT_MODE.
+
+    'development' runs migrate() on every start. 'production' runs no DDL:
+    it reads the stored schema version in one query. If that is behind,
+    requests answer 503 until `flask schema migrate` has run.
+
+    Returns:
+        bool: Whether the schema is current.
+    """
+    mode = app.config.setdefault('BOOT_MODE', 'development')
+    if mode not in BOOT_MODES:
+        raise ValueError(f'Unknown BOOT_MODE {mode!r}, expected one of {BOOT_MODES}')
+    with app.app_context():
+        if mode == 'development':
+            migrate()
+            version = SCHEMA_VERSION
+        else:
+            version = current_version()
+    app.extensions['schema_current'] = version == SCHEMA_VERSION
+    if not app.extensions['schema_current']:
+        logger.error('Database schema is at version %s, this code needs %s; run `flask schema migrate`',
+                     version, SCHEMA_VERSION)
+        app.before_request(_require_current_schema)
+    return app.extensions['schema_current']
+
+
+def _require_current_schema():
+    if current_app.extensions['schema_current']:
+        return
+    if current_version() != SCHEMA_VERSION:
+        abort(503, description='The database schema is out of date.')
+    current_app.extensions['schema_current'] = True
+
+
+@schema_cli.command('migrate')
+def migrate_command():
+    """Create missing tables, columns and indexes and record the schema version."""
+    changes = migrate()
+    for change in changes:
+        click.echo(change)
+    click.echo(f'Schema is at version {SCHEMA_VERSION}, {len(changes)} change(s) applied.')
+
+
+@schema_cli.command('status')
+def status_command():
+    """Show the stored schema version and the one this code expects."""
+    version = current_version()
+    state = 'current' if version == SCHEMA_VERSION else 'needs `flask schema migrate`'
+    click.echo(f'Database schema version {version}, code expects {SCHEMA_VERSION}: {state}.')
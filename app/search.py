@@ -0,0 +1,199 @@
+import logging
+import re
+from datetime import datetime, time, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, union_all, inspect, literal_column, null, table, text, or_, and_
+from sqlalchemy.exc import OperationalError
+from .models import db, User, Expense, ArchivedExpense
+from .queries import SearchHit
+from .money import to_cents
+
+logger = logging.getLogger(__name__)
+
+# CLI group registered by create_app: `flask search rebuild`
+search_cli = AppGroup('search', help='Maintain the expense full-text index.')
+
+# SQLite FTS5 table indexing open and archived expense descriptions by expense ID
+FTS_TABLE = 'expense_fts'
+# Search terms used from one query; the rest are ignored
+MAX_TERMS = 8
+# Cross-project searches over more projects than this aren't narrowed inside the FTS query
+MAX_PROJECT_TOKENS = 100
+
+# Archived expenses keep their ID, so one FTS row follows an expense through
+# settlement: the delete trigger keeps the row when the expense was archived.
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "description, project, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"""CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, description, project) VALUES (new.id, new.description, 'p' || new.project_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF description ON expense BEGIN
+        UPDATE {FTS_TABLE} SET description = new.description WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense
+    WHEN NOT EXISTS (SELECT 1 FROM archived_expense WHERE id = old.id) BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS archived_expense_fts_delete AFTER DELETE ON archived_expense BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+)
+SQLITE_POPULATE = (
+    f"INSERT INTO {FTS_TABLE} (rowid, description, project) "
+    "SELECT id, description, 'p' || project_id FROM expense "
+    "UNION ALL SELECT id, description, 'p' || project_id FROM archived_expense"
+)
+# FULLTEXT indexes on MySQL; InnoDB keeps them in sync by itself
+MYSQL_INDEXES = {'expense': 'ix_expense_description_ft', 'archived_expense': 'ix_archived_expense_description_ft'}
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def supported():
+    """
+    Check whether the database backend has a full-text index for descriptions.
+    """
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        return bool(db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+        ).scalar())
+    return dialect == 'mysql'
+
+
+def ensure_index():
+    """
+    Create the full-text index and its sync triggers if they don't exist yet.
+
+    A newly created SQLite index is filled from the existing expenses.
+    Backends without full-text support are left alone; searching by text
+    then answers 501 while the filters keep working.
+    """
+    dialect = _dialect()
+    try:
+        if dialect == 'sqlite':
+            exists = supported()
+            for statement in SQLITE_DDL:
+                db.session.execute(text(statement))
+            if not exists:
+                db.session.execute(text(SQLITE_POPULATE))
+        elif dialect == 'mysql':
+            inspector = inspect(db.engine)
+            for table_name, index_name in MYSQL_INDEXES.items():
+                if index_name not in {index['name'] for index in inspector.get_indexes(table_name)}:
+                    db.session.execute(text(f'CREATE FULLTEXT INDEX {index_name} ON {table_name} (description)'))
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+        logger.warning('Full-text search is unavailable on this %s database', dialect, exc_info=True)
+
+
+def rebuild_index():
+    """
+    Refill the SQLite full-text index from the expense tables.
+
+    Returns the number of indexed expenses.
+    """
+    if _dialect() != 'sqlite':
+        return None  # MySQL maintains its FULLTEXT indexes itself
+    ensure_index()
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    db.session.execute(text(SQLITE_POPULATE))
+    db.session.commit()
+    return db.session.execute(text(f'SELECT COUNT(*) FROM {FTS_TABLE}')).scalar()
+
+
+def terms(query):
+    """
+    Split a search query into at most MAX_TERMS lower-case word terms.
+
+    Only word characters are kept, so user input can't inject full-text
+    query syntax.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _text_filter(model, words, project_ids):
+    if _dialect() == 'mysql':
+        from sqlalchemy.dialects.mysql import match
+        return match(model.description, against=' '.join(f'+{word}*' for word in words)).in_boolean_mode()
+    expression = 'description : (' + ' '.join(f'"{word}"*' for word in words) + ')'
+    if len(project_ids) <= MAX_PROJECT_TOKENS:
+        # Narrow the match to the projects' tokens before joining back to the expense tables.
+        expression += ' AND project : (' + ' OR '.join(f'"p{int(pid)}"' for pid in project_ids) + ')'
+    matches = select(literal_column('rowid')).select_from(table(FTS_TABLE)).where(
+        literal_column(FTS_TABLE).op('MATCH')(expression))
+    return model.id.in_(matches)
+
+
+def search(project_ids, query=None, payer_ids=None, min_amount=None, max_amount=None,
+           start=None, end=None, after=None, limit=50, settled=True):
+    """
+    Search the open and settled expenses of some projects, newest first.
+
+    Args:
+        project_ids (list): Projects to search.
+        query (str): Words that must all appear in the description (prefix
+            matches); requires supported().
+        payer_ids (list): Only expenses paid by these users.
+        min_amount, max_amount (float): Inclusive amount range.
+        start, end (date): Inclusive range of creation days.
+        after (tuple): (created_at, id) keyset cursor of the previous page.
+        limit (int): Maximum number of hits.
+        settled (bool): Include settled (archived) expenses; False searches open ones only.
+
+    Returns:
+        list: SearchHit tuples, ordered by (created_at, id) descending.
+
+    Each of the two tables is searched with its own ordered, limited query,
+    so the filters run on the composite (project_id, ...) indexes or the
+    full-text index and no LIKE scan is involved.
+    """
+    words = terms(query) if query else []
+    if (query and not words) or not project_ids or (payer_ids is not None and not payer_ids):
+        return []
+
+    branches = []
+    for model in (Expense, ArchivedExpense) if settled else (Expense,):
+        settlement_id = model.settlement_id if model is ArchivedExpense else null()
+        stmt = (
+            select(model.id, model.description, model.amount_cents, User.username, model.created_at,
+                   model.project_id, settlement_id.label('settlement_id'))
+            .join(User, model.user_id == User.id)
+            .where(model.project_id.in_(project_ids))
+        )
+        if words:
+            stmt = stmt.where(_text_filter(model, words, project_ids))
+        if payer_ids is not None:
+            stmt = stmt.where(model.user_id.in_(payer_ids))
+        if min_amount is not None:
+            stmt = stmt.where(model.amount_cents >= to_cents(min_amount))
+        if max_amount is not None:
+            stmt = stmt.where(model.amount_cents <= to_cents(max_amount))
+        if start is not None:
+            stmt = stmt.where(model.created_at >= datetime.combine(start, time.min))
+        if end is not None:
+            stmt = stmt.where(model.created_at < datetime.combine(end + timedelta(days=1), time.min))
+        if after is not None:
+            created_at, expense_id = after
+            stmt = stmt.where(or_(model.created_at < created_at,
+                                  and_(model.created_at == created_at, model.id < expense_id)))
+        branches.append(select(stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit).subquery()))
+
+    hits = union_all(*branches).subquery()
+    rows = db.session.execute(select(hits).order_by(hits.c.created_at.desc(), hits.c.id.desc()).limit(limit))
+    return [SearchHit._make(row) for row in rows]
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Refill the full-text index from the expense tables."""
+    indexed = rebuild_index()
+    if indexed is None:
+        click.echo('Nothing to rebuild, the database maintains its full-text index itself.')
+    else:
+        click.echo(f'Search index rebuilt, {indexed} expense(s) indexed.')
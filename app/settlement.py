@@ -0,0 +1,145 @@
+import heapq
+from collections import namedtuple
+
+# Exact minimum-transfer search is exponential; above this many non-zero
+# balances settle() falls back to the greedy heap matching.
+EXACT_MAX_PARTIES = 14
+
+Transfer = namedtuple('Transfer', ['payer', 'receiver', 'amount_cents'])
+
+
+def split_evenly(total_cents, n):
+    """
+    Split an amount in cents into n integer shares that sum exactly to the total.
+
+    The remainder cents go to the first shares (largest remainder with equal weights).
+    """
+    if n <= 0:
+        return []
+    base, remainder = divmod(total_cents, n)
+    return [base + 1 if i < remainder else base for i in range(n)]
+
+
+def split_evenly_array(totals, member_mask):
+    """
+    Vectorized split_evenly() of several totals at once.
+
+    Args:
+        totals (numpy.ndarray): int64 cents to split, one per column (e.g. per bucket).
+        member_mask (numpy.ndarray): bool per row (user), True for the users sharing the totals.
+
+    Returns:
+        numpy.ndarray: int64 (users x totals) shares. Each column sums exactly to
+        its total; the remainder cents go to the first members (largest
+        remainder with equal weights), non-members get nothing.
+    """
+    import numpy as np
+
+    n = int(member_mask.sum())
+    if n == 0:
+        return np.zeros((len(member_mask), len(totals)), dtype=np.int64)
+    base, remainder = np.divmod(np.asarray(totals, dtype=np.int64), n)
+    rank = np.cumsum(member_mask) - 1
+    shares = base[np.newaxis, :] + (rank[:, np.newaxis] < remainder[np.newaxis, :])
+    return np.where(member_mask[:, np.newaxis], shares, 0)
+
+
+def net_balances(paid_cents, members):
+    """
+    Compute net balances in cents for an evenly split pool.
+
+    Args:
+        paid_cents (dict): Maps a key (user ID, username, ...) to the cents that user paid.
+        members (list): Keys sharing the total, in a stable order.
+
+    Returns:
+        dict: Maps each key to its net balance. A positive balance means the
+        user owes money, a negative one that they are owed. Keys in paid_cents
+        that are not members (e.g. removed participants) get no share, so they
+        are paid back in full. The balances always sum to zero.
+    """
+    total = sum(paid_cents.values())
+    balances = {key: -amount for key, amount in paid_cents.items()}
+    for key, share in zip(members, split_evenly(total, len(members))):
+        balances[key] = balances.get(key, 0) + share
+    return balances
+
+
+def settle(balances, exact=False):
+    """
+    Turn net balances into a list of transfers that settles them.
+
+    Args:
+        balances (dict): Maps a key to its net balance in integer cents, positive
+            meaning the user owes money. Must sum to zero.
+        exact (bool): Search for the minimum number of transfers. Only used for
+            groups of at most EXACT_MAX_PARTIES non-zero balances.
+
+    Returns:
+        list: Transfer(payer, receiver, amount_cents) tuples.
+
+    The default mode greedily matches the largest debtor with the largest
+    creditor using two heaps, which runs in O(n log n) and needs at most
+    n - 1 transfers.
+    """
+    if sum(balances.values()) != 0:
+        raise ValueError('Balances must sum to zero.')
+    parties = [(key, amount) for key, amount in balances.items() if amount != 0]
+    if exact and len(parties) <= EXACT_MAX_PARTIES:
+        transfers = []
+        for group in _zero_sum_groups([amount for _, amount in parties]):
+            transfers.extend(_greedy([parties[i] for i in group]))
+        return transfers
+    return _greedy(parties)
+
+
+def _greedy(parties):
+    # Heaps are keyed on (-amount, position) so ties are broken by input order.
+    debtors = [(-amount, i, key) for i, (key, amount) in enumerate(parties) if amount > 0]
+    creditors = [(amount, i, key) for i, (key, amount) in enumerate(parties) if amount < 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        owed, i, payer = heapq.heappop(debtors)
+        credit, j, receiver = heapq.heappop(creditors)
+        amount = min(-owed, -credit)
+        transfers.append(Transfer(payer, receiver, amount))
+        if owed + amount < 0:
+            heapq.heappush(debtors, (owed + amount, i, payer))
+        if credit + amount < 0:
+            heapq.heappush(creditors, (credit + amount, j, receiver))
+    return transfers
+
+
+def _zero_sum_groups(amounts):
+    """
+    Partition amounts into the largest number of zero-sum groups.
+
+    A group of k balances can always be settled with k - 1 transfers, so
+    maximising the number of groups minimises the total transfer count.
+    Runs in O(2^n * n) over bitmasks.
+    """
+    n = len(amounts)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        best[mask] = max(best[mask ^ (1 << i)] for i in range(n) if mask >> i & 1) + (sums[mask] == 0)
+
+    # Walk back from the full set; every zero-sum mask on the path closes a group.
+    groups = []
+    mask, boundary = full, full
+    while mask:
+        for i in range(n):
+            bit = 1 << i
+            if mask & bit and best[mask] == best[mask ^ bit] + (sums[mask] == 0):
+                mask ^= bit
+                break
+        if sums[mask] == 0:
+            groups.append([i for i in range(n) if (boundary ^ mask) >> i & 1])
+            boundary = mask
+    return groups
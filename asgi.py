@@ -0,0 +1,4 @@
+from app.async_api import create_async_app
+
+# Create the ASGI application of the async JSON API; serve it with e.g. `uvicorn asgi:app`.
+app = create_async_app()
@@ -0,0 +1,264 @@
+"""
+Load test of the async API tier against the sync Flask routes.
+
+Serves the same SQLite database twice, each server in its own process: the
+Flask app on a threaded WSGI server (one thread per connection, as the sync
+routes run today) and app.async_api on uvicorn. Client processes then keep
+10, 100 and 1000 concurrent clients busy with a mix of project list reads,
+expense page reads and expense inserts, and the run reports throughput,
+p50/p95/p99 latency and errors per tier and concurrency level. Results are
+written as JSON so runs can be compared across commits; with --baseline the
+run fails when a tier's throughput dropped more than allowed.
+
+Usage:
+    python benchmarks/datagen.py --db sqlite:////tmp/expense_bench.db --scale small
+    python benchmarks/bench_async.py --db sqlite:////tmp/expense_bench.db --output after.json
+
+Expense inserts change the data, so file databases are copied to a
+temporary file first. Without --db a database is generated at --scale.
+The clients use httpx, which the app itself doesn't need.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httpx  # noqa: E402
+from sqlalchemy import select, union  # noqa: E402
+
+from app.models import Project, ProjectParticipant  # noqa: E402
+from app.routes import API_WRITE_HEADER  # noqa: E402
+from bench_routes import percentile, git_commit  # noqa: E402
+from datagen import SCALES, bench_app, generate  # noqa: E402
+
+TIERS = ('sync', 'async')
+# Share of each request kind in the mix; the rest are expense page reads
+PROJECTS_SHARE = 0.3
+# Users whose sessions the clients share
+SESSIONS = 50
+SECRET_KEY = 'benchmark'
+
+
+def serve(tier, db_uri, port):
+    """
+    Run one tier's server in this process until it is terminated.
+    """
+    if tier == 'async':
+        import uvicorn
+        from app.async_api import create_async_app
+        app = create_async_app({'SECRET_KEY': SECRET_KEY, 'SQLALCHEMY_DATABASE_URI': db_uri})
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='error', backlog=4096)
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No access log
+        app = bench_app(db_uri, BOOT_MODE='production', JOB_WORKERS=0)
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        server.socket.listen(4096)
+        server.serve_forever()
+
+
+def start_server(tier, db_uri):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, '--serve', tier, '--db', db_uri, '--port', str(port)])
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'{url}/api/projects', timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'{tier} server did not start')
+
+
+def plan_sessions(db_uri, rng):
+    """
+    Return (session cookie, project IDs) pairs for SESSIONS users with projects.
+    """
+    from flask.sessions import SecureCookieSessionInterface
+    from app import db
+
+    app = bench_app(db_uri, BOOT_MODE='production', JOB_WORKERS=0)
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    with app.app_context():
+        pairs = db.session.execute(union(
+            select(Project.creator_id, Project.id),
+            select(ProjectParticipant.user_id, ProjectParticipant.project_id),
+        )).all()
+    by_user = {}
+    for user_id, project_id in pairs:
+        by_user.setdefault(user_id, []).append(project_id)
+    users = rng.sample(sorted(by_user), min(SESSIONS, len(by_user)))
+    return [(serializer.dumps({'_user_id': str(user_id), '_fresh': True}), by_user[user_id]) for user_id in users]
+
+
+def _request(tier, rng, project_ids, write_ratio):
+    roll = rng.random()
+    project_id = rng.choice(project_ids)
+    if roll < write_ratio:
+        amount = round(rng.uniform(1, 200), 2)
+        if tier == 'async':
+            return 'POST', f'/api/projects/{project_id}/expenses', {'json': {'description': 'load test', 'amount': amount}}
+        data = {'expense-description': 'load test', 'expense-amount': str(amount)}
+        return 'POST', f'/project/{project_id}', {'data': data}
+    if roll < write_ratio + PROJECTS_SHARE:
+        return 'GET', '/api/projects', {}
+    return 'GET', f'/api/projects/{project_id}/expenses', {'params': {'limit': 50}}
+
+
+async def _clients(tier, url, sessions, clients, duration, write_ratio, seed):
+    latencies = []
+    statuses = {}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as http:
+        deadline = time.monotonic() + duration
+
+        async def client(index):
+            rng = random.Random(seed * 100003 + index)
+            cookie, project_ids = sessions[index % len(sessions)]
+            while time.monotonic() < deadline:
+                method, path, kwargs = _request(tier, rng, project_ids, write_ratio)
+                start = time.perf_counter()
+                try:
+                    response = await http.request(method, path, headers={'Cookie': f'session={cookie}', API_WRITE_HEADER: 'bench'}, **kwargs)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        await asyncio.gather(*(client(index) for index in range(clients)))
+    return latencies, statuses
+
+
+def _client_process(args):
+    return asyncio.run(_clients(*args))
+
+
+def run_level(tier, url, sessions, concurrency, duration, write_ratio, processes, seed):
+    """
+    Keep `concurrency` clients busy for `duration` seconds and summarize the responses.
+    """
+    processes = min(processes, concurrency)
+    shares = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    jobs = [(tier, url, sessions[i::processes] or sessions, share, duration, write_ratio, seed + i)
+            for i, share in enumerate(shares)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_client_process, jobs)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for part, _ in results for latency in part)
+    statuses = {}
+    for _, part in results:
+        for status, count in part.items():
+            statuses[status] = statuses.get(status, 0) + count
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        'requests': len(latencies),
+        'ok': ok,
+        'errors': {status: count for status, count in sorted(statuses.items())
+                   if not status.isdigit() or int(status) >= 400},
+        'throughput_rps': round(ok / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """
+    Return a list of throughput regressions of results against a baseline run.
+    """
+    failures = []
+    for tier, levels in results['tiers'].items():
+        for level, current in levels.items():
+            before = baseline.get('tiers', {}).get(tier, {}).get(level)
+            if before and current['throughput_rps'] < before['throughput_rps'] * (1 - max_regression):
+                failures.append(f'{tier} @ {level} clients: {current["throughput_rps"]} req/s '
+                                f'vs {before["throughput_rps"]} req/s')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the async API tier against the sync routes.')
+    parser.add_argument('--db', help='SQLite database filled by datagen.py; generated at --scale when omitted.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--concurrency', default='10,100,1000', help='Concurrent clients per level.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per tier and level.')
+    parser.add_argument('--write-ratio', type=float, default=0.05, help='Share of requests that add an expense.')
+    parser.add_argument('--tiers', default=','.join(TIERS))
+    parser.add_argument('--client-processes', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Processes running the clients; half the CPUs by default.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative throughput drop before --baseline fails the run.')
+    parser.add_argument('--serve', choices=TIERS, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.db, args.port)
+
+    workdir = tempfile.mkdtemp(prefix='expense_async_')
+    db_path = os.path.join(workdir, 'bench.db')
+    db_uri = f'sqlite:///{db_path}'
+    try:
+        if args.db:
+            shutil.copyfile(args.db.removeprefix('sqlite:///'), db_path)
+        else:
+            app = bench_app(db_uri, JOB_WORKERS=0)
+            with app.app_context():
+                generate(seed=args.seed, log=lambda *a: None, **SCALES[args.scale])
+        sessions = plan_sessions(db_uri, random.Random(args.seed))
+
+        results = {'commit': git_commit(), 'db': args.db or args.scale, 'duration': args.duration,
+                   'write_ratio': args.write_ratio, 'tiers': {}}
+        for tier in args.tiers.split(','):
+            process, url = start_server(tier, db_uri)
+            try:
+                results['tiers'][tier] = {}
+                for concurrency in (int(c) for c in args.concurrency.split(',')):
+                    stats = run_level(tier, url, sessions, concurrency, args.duration, args.write_ratio,
+                                      args.client_processes, args.seed)
+                    results['tiers'][tier][str(concurrency)] = stats
+                    print(f'{tier:6} {concurrency:5} clients  {stats["throughput_rps"]:9.1f} req/s  '
+                          f'p50 {stats["p50_ms"]} ms  p95 {stats["p95_ms"]} ms  p99 {stats["p99_ms"]} ms  '
+                          f'errors {stats["errors"] or 0}')
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of the read path used by the project page: ORM entities vs. Core-row DTOs.
+
+Loads the open expenses of the largest project (as the project page and
+the expense API do) once through full ORM hydration, Expense plus
+joined-loaded User, and once through app.queries. Each loop reads the
+fields the template shows. Reports latency (p50/p95 and microseconds per
+row) and memory per row, both retained by the result list and at peak
+while loading.
+
+Usage:
+    python benchmarks/datagen.py --db sqlite:////tmp/expense_bench.db --scale medium
+    python benchmarks/bench_read_path.py --db sqlite:////tmp/expense_bench.db [--iterations 20] [--output read.json]
+
+Without --db an in-memory database is generated at --scale first.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import db, queries  # noqa: E402
+from app.models import Expense, ProjectBalance  # noqa: E402
+from bench_routes import percentile, git_commit  # noqa: E402
+from datagen import SCALES, bench_app, generate  # noqa: E402
+
+
+def load_orm(project_id):
+    expenses = (Expense.query.options(joinedload(Expense.user)).filter_by(project_id=project_id)
+                .order_by(Expense.created_at.desc(), Expense.id.desc()).all())
+    for expense in expenses:
+        expense.description, expense.amount, expense.user.username, expense.created_at
+    return expenses
+
+
+def load_dto(project_id):
+    expenses = queries.project_expenses(project_id)
+    for expense in expenses:
+        expense.description, expense.amount, expense.payer, expense.created_at
+    return expenses
+
+
+PATHS = {'orm': load_orm, 'dto': load_dto}
+
+
+def largest_project():
+    return db.session.execute(
+        select(ProjectBalance.project_id)
+        .group_by(ProjectBalance.project_id)
+        .order_by(db.func.sum(ProjectBalance.expense_count).desc())
+        .limit(1)
+    ).scalar()
+
+
+def measure(load, project_id, iterations):
+    timings = []
+    rows = 0
+    for _ in range(iterations):
+        db.session.remove()  # Start every run with an empty identity map
+        start = time.perf_counter()
+        rows = len(load(project_id))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    db.session.remove()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = load(project_id)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    db.session.remove()
+
+    return {
+        'rows': rows,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'us_per_row': round(percentile(timings, 50) / max(rows, 1) * 1e6, 3),
+        'retained_bytes_per_row': round((retained - before) / max(rows, 1), 1),
+        'peak_bytes_per_row': round((peak - before) / max(rows, 1), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the ORM and DTO read paths.')
+    parser.add_argument('--db', help='Database filled by datagen.py; generated in memory when omitted.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--project', type=int, help='Project to load; defaults to the one with most expenses.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    app = bench_app(args.db or 'sqlite://')
+    with app.app_context():
+        if not args.db:
+            generate(log=lambda message: None, **SCALES[args.scale])
+        project_id = args.project or largest_project()
+        results = {name: measure(load, project_id, args.iterations) for name, load in PATHS.items()}
+
+    orm, dto = results['orm'], results['dto']
+    report = {
+        'commit': git_commit(),
+        'project_id': project_id,
+        'paths': results,
+        'speedup': round(orm['p50_ms'] / dto['p50_ms'], 2) if dto['p50_ms'] else None,
+        'memory_ratio': round(orm['retained_bytes_per_row'] / dto['retained_bytes_per_row'], 2)
+        if dto['retained_bytes_per_row'] else None,
+    }
+    for name, result in results.items():
+        print(f"{name:4} {result['rows']:>8} rows  p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  "
+              f"{result['us_per_row']:>7.3f} us/row  {result['retained_bytes_per_row']:>7.1f} B/row retained  "
+              f"{result['peak_bytes_per_row']:>7.1f} B/row peak")
+    print(f"dto is {report['speedup']}x faster and retains {report['memory_ratio']}x less memory per row")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
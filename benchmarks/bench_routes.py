@@ -0,0 +1,207 @@
+"""
+Route-level benchmark driven through the Flask test client.
+
+Runs index, project, api_projects, api_project_expenses and settle_project
+against a local SQLite database filled by datagen.py and reports, per route,
+p50/p95/p99 latency, queries per request and peak Python memory. Results are
+written as JSON so runs can be compared across commits; with --baseline the
+run fails when a route got slower or issues more queries than allowed.
+
+Usage:
+    python benchmarks/datagen.py --db sqlite:////tmp/expense_bench.db --scale medium
+    python benchmarks/bench_routes.py --db sqlite:////tmp/expense_bench.db --output after.json --baseline before.json
+
+Settling deletes data, so file databases are copied to a temporary file and
+the benchmark runs against the copy. Without --db an in-memory database is
+generated at --scale first.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import event, select  # noqa: E402
+
+from app import db  # noqa: E402
+from app.models import Project, ProjectParticipant  # noqa: E402
+from datagen import SCALES, bench_app, generate  # noqa: E402
+
+ROUTES = ('index', 'project', 'api_projects', 'api_project_expenses', 'settle_project')
+# Requests repeated with tracemalloc on to measure peak memory
+MEMORY_SAMPLES = 20
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def plan_requests(rng, projects, route, iterations):
+    """
+    Pick (user_id, method, url) tuples for a route.
+    """
+    requests = []
+    if route == 'settle_project':
+        for project_id, members in rng.sample(projects, min(iterations, len(projects))):
+            requests.append((members[0], 'POST', f'/project/{project_id}/settle'))
+        return requests
+    for _ in range(iterations):
+        project_id, members = rng.choice(projects)
+        user_id = rng.choice(members)
+        url = {
+            'index': '/',
+            'project': f'/project/{project_id}',
+            'api_projects': '/api/projects?stats=1',
+            'api_project_expenses': f'/api/projects/{project_id}/expenses',
+        }[route]
+        requests.append((user_id, 'GET', url))
+    return requests
+
+
+def run_route(app, client, counter, planned, trace_memory):
+    latencies, queries, peak = [], [], 0
+    for user_id, method, url in planned:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        if trace_memory:
+            tracemalloc.start()
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method)
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+        queries.append(counter.count)
+        if trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
+    latencies.sort()
+    return {
+        'requests': len(planned),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_queries': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1) if trace_memory else None,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """
+    Return a list of regressions of results against a baseline run.
+    """
+    failures = []
+    for route, current in results['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            failures.append(f'{route}: p95 {current["p95_ms"]} ms vs {before["p95_ms"]} ms')
+        if current['max_queries'] > before['max_queries']:
+            failures.append(f'{route}: up to {current["max_queries"]} queries vs {before["max_queries"]}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main routes.')
+    parser.add_argument('--db', help='SQLite database filled by datagen.py (copied before running).')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='Scale of the in-memory data set used when --db is not given.')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--cache', default='null', help='CACHE_BACKEND to run with (default: caching off).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative p95 slowdown before --baseline fails the run.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='expense_bench_')
+    try:
+        if args.db:
+            source = args.db.replace('sqlite:///', '', 1)
+            copy = os.path.join(workdir, 'bench.db')
+            shutil.copy(source, copy)
+            db_uri = f'sqlite:///{copy}'
+        else:
+            db_uri = 'sqlite://'
+        app = bench_app(db_uri, CACHE_BACKEND=args.cache)
+
+        with app.app_context():
+            if not args.db:
+                generate(seed=args.seed, log=lambda message: None, **SCALES[args.scale])
+            members = {pid: [creator] for pid, creator in db.session.execute(select(Project.id, Project.creator_id))}
+            for pid, uid in db.session.execute(select(ProjectParticipant.project_id, ProjectParticipant.user_id)):
+                members[pid].append(uid)
+            projects = sorted(members.items())
+            counter = QueryCounter(db.engine)
+
+        rng = random.Random(args.seed)
+        client = app.test_client()
+        results = {'commit': git_commit(), 'db': args.db or f'memory:{args.scale}', 'cache': args.cache,
+                   'projects': len(projects), 'routes': {}}
+        for route in args.routes.split(','):
+            if route == 'settle_project':
+                # A settled project has nothing left to settle, so memory is traced on projects of its own
+                planned = plan_requests(rng, projects, route, args.iterations + MEMORY_SAMPLES)
+                planned, traced = planned[:args.iterations], planned[args.iterations:]
+            else:
+                planned = plan_requests(rng, projects, route, args.iterations)
+                traced = planned[:MEMORY_SAMPLES]
+                run_route(app, client, counter, planned[:10], trace_memory=False)  # Warm-up
+            stats = run_route(app, client, counter, planned, trace_memory=False)
+            stats['peak_memory_kb'] = (run_route(app, client, counter, traced, trace_memory=True)['peak_memory_kb']
+                                       if traced else None)
+            results['routes'][route] = stats
+            print(f'{route:22} p50 {stats["p50_ms"]:8.2f} ms  p95 {stats["p95_ms"]:8.2f} ms  '
+                  f'p99 {stats["p99_ms"]:8.2f} ms  queries {stats["mean_queries"]:6.2f}  '
+                  f'peak {stats["peak_memory_kb"]} KB')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
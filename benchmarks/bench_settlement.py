@@ -0,0 +1,75 @@
+"""
+Benchmark for the settlement engine in app.settlement.
+
+Generates synthetic groups with random payments, computes net balances and
+settles them, reporting wall time (total and for the balance step alone)
+and the number of transfers per group size.
+
+Usage:
+    python benchmarks/bench_settlement.py [--sizes 10,1000,100000] [--seed 42]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.settlement import net_balances, settle, EXACT_MAX_PARTIES  # noqa: E402
+
+
+def synthetic_group(size, rng):
+    """
+    Build a group where roughly a third of the members paid something.
+    """
+    paid = {}
+    for member in range(size):
+        if rng.random() < 0.33:
+            paid[member] = rng.randint(100, 50000)
+    return paid, list(range(size))
+
+
+def run(size, rng, exact=False):
+    paid, members = synthetic_group(size, rng)
+    start = time.perf_counter()
+    balances = net_balances(paid, members)
+    balanced = time.perf_counter()
+    transfers = settle(balances, exact=exact)
+    elapsed = time.perf_counter() - start
+
+    # Sanity check: applying the transfers must zero every balance.
+    for payer, receiver, amount in transfers:
+        balances[payer] -= amount
+        balances[receiver] += amount
+    assert not any(balances.values()), 'settlement left residue'
+
+    return {
+        'participants': size,
+        'mode': 'exact' if exact else 'greedy',
+        'seconds': round(elapsed, 6),
+        'balance_seconds': round(balanced - start, 6),
+        'transfers': len(transfers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='10,1000,100000')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        results.append(run(size, rng))
+        if size <= EXACT_MAX_PARTIES:
+            results.append(run(size, rng, exact=True))
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Startup benchmark: worker boot time per BOOT_MODE.
+
+Each sample runs in a fresh interpreter and records the time to import the
+app package, to run create_app() and to serve the first request (GET
+/login, which loads the forms and templates that boot defers), plus the
+queries issued before that first request. Results are written as JSON so
+runs can be compared across commits; with --baseline the run fails when
+boot got slower or issues more queries than allowed.
+
+Usage:
+    python benchmarks/bench_startup.py --output after.json --baseline before.json
+    python benchmarks/bench_startup.py --db sqlite:////tmp/expense_bench.db --runs 30
+
+The database is migrated once before measuring, so the production samples
+see a current schema. Without --db a temporary SQLite file is used.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_routes import percentile, git_commit  # noqa: E402
+
+BOOT_MODES = ('development', 'production')
+PHASES = ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms')
+
+# Runs inside the measured interpreter; reports its timings as JSON on stdout.
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+from app import create_app
+imported = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: queries.append(1))
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[2], 'BOOT_MODE': sys.argv[3], 'SECRET_KEY': 'benchmark',
+                  'JOB_WORKERS': 0, 'CACHE_BACKEND': 'null', 'SLOW_QUERY_MS': 0})
+created = time.perf_counter()
+boot_queries = len(queries)
+status = app.test_client().get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'boot_queries': boot_queries, 'status': status}))
+'''
+
+
+def sample(db_uri, mode):
+    """
+    Boot the app once in a new interpreter and return its timings.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', CHILD, root, db_uri, mode], text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total_ms'] = (time.perf_counter() - start) * 1000  # Includes interpreter startup
+    if result['status'] != 200:
+        raise SystemExit(f'{mode} boot answered {result["status"]} to its first request')
+    return result
+
+
+def summarize(samples):
+    stats = {}
+    for phase in PHASES:
+        values = sorted(s[phase] for s in samples)
+        stats[f'{phase[:-3]}_p50_ms'] = round(percentile(values, 50), 3)
+        stats[f'{phase[:-3]}_p95_ms'] = round(percentile(values, 95), 3)
+    stats['boot_queries'] = max(s['boot_queries'] for s in samples)
+    return stats
+
+
+def compare(results, baseline, max_regression):
+    """
+    Return a list of regressions of results against a baseline run.
+    """
+    failures = []
+    for mode, current in results['modes'].items():
+        before = baseline.get('modes', {}).get(mode)
+        if not before:
+            continue
+        for key in ('create_app_p50_ms', 'first_request_p50_ms', 'total_p50_ms'):
+            if key in before and current[key] > before[key] * (1 + max_regression):
+                failures.append(f'{mode}: {key} {current[key]} ms vs {before[key]} ms')
+        if current['boot_queries'] > before.get('boot_queries', current['boot_queries']):
+            failures.append(f'{mode}: {current["boot_queries"]} boot queries vs {before["boot_queries"]}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark worker startup per boot mode.')
+    parser.add_argument('--db', help='SQLite database to boot against; a temporary one is used when omitted.')
+    parser.add_argument('--runs', type=int, default=15, help='Fresh interpreters per boot mode.')
+    parser.add_argument('--modes', default=','.join(BOOT_MODES))
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative slowdown before --baseline fails the run.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='expense_startup_')
+    try:
+        db_uri = args.db or f'sqlite:///{os.path.join(workdir, "startup.db")}'
+        sample(db_uri, 'development')  # Migrates the database and warms the bytecode cache
+
+        results = {'commit': git_commit(), 'db': args.db or 'temporary', 'runs': args.runs, 'modes': {}}
+        for mode in args.modes.split(','):
+            stats = summarize([sample(db_uri, mode) for _ in range(args.runs)])
+            results['modes'][mode] = stats
+            print(f'{mode:12} import {stats["import_p50_ms"]:8.2f} ms  create_app {stats["create_app_p50_ms"]:8.2f} ms  '
+                  f'first request {stats["first_request_p50_ms"]:8.2f} ms  total {stats["total_p50_ms"]:8.2f} ms  '
+                  f'queries {stats["boot_queries"]}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Synthetic data generator for benchmarks.
+
+Fills a database with users, projects, participants and expenses at a
+configurable scale. Participant and expense counts per project follow a
+Pareto distribution, so a few projects are very large while most are small.
+The balance ledger and the spend rollups are written alongside, so the
+data is immediately consistent with what the app maintains.
+
+Usage:
+    python benchmarks/datagen.py --db sqlite:////tmp/bench.db --users 10000 --projects 50000 --expenses 5000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app, db, rollups  # noqa: E402
+from app.models import User, Project, ProjectParticipant, Expense, ProjectBalance  # noqa: E402
+
+# Password of every generated user
+PASSWORD = 'benchmark'
+# Rows per executemany batch
+CHUNK_SIZE = 10000
+# Upper bound for the Pareto-distributed participant count of one project
+MAX_PARTICIPANTS = 500
+
+SCALES = {
+    'small': {'users': 200, 'projects': 1000, 'expenses': 50000},
+    'medium': {'users': 2000, 'projects': 10000, 'expenses': 500000},
+    'large': {'users': 10000, 'projects': 50000, 'expenses': 5000000},
+}
+
+DESCRIPTIONS = ['fuel', 'groceries', 'dinner', 'hotel', 'train tickets', 'coffee', 'rent',
+                'electricity', 'museum', 'taxi', 'drinks', 'ski pass', 'parking', 'snacks']
+
+
+def bench_app(db_uri, **config):
+    """
+    Build the app against a local database with caching and query budgets off.
+
+    Jobs run inline (JOB_WORKERS=0), so a settle handed to the job queue is
+    still measured by the request that triggered it.
+    """
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SECRET_KEY': 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+        'CACHE_BACKEND': 'null',
+        'QUERY_BUDGET_ENFORCE': False,
+        'SLOW_QUERY_MS': 0,
+        'JOB_WORKERS': 0,
+        **config,
+    })
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(insert(model), chunk)
+    db.session.commit()
+
+
+def generate(users, projects, expenses, seed=42, skew=1.2, log=print):
+    """
+    Insert synthetic data into the database of the current app context.
+
+    Returns a dict with the generated row counts.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256', salt_length=8)
+
+    _insert(User, ({'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': password}
+                   for i in range(1, users + 1)))
+    log(f'{users} users')
+
+    epoch = datetime(2020, 1, 1)
+    creators = [rng.randint(1, users) for _ in range(projects)]
+    _insert(Project, ({'id': i, 'name': f'Project {i}', 'creator_id': creators[i - 1],
+                       'created_at': epoch + timedelta(minutes=i)} for i in range(1, projects + 1)))
+    log(f'{projects} projects')
+
+    members = []
+    participant_rows = []
+    for project_id, creator_id in enumerate(creators, start=1):
+        count = min(int(rng.paretovariate(skew)), MAX_PARTICIPANTS, users - 1)
+        others = set()
+        while len(others) < count:
+            user_id = rng.randint(1, users)
+            if user_id != creator_id:
+                others.add(user_id)
+        members.append([creator_id] + sorted(others))
+        participant_rows.extend({'project_id': project_id, 'user_id': user_id} for user_id in sorted(others))
+    _insert(ProjectParticipant, participant_rows)
+    log(f'{len(participant_rows)} participants')
+
+    # Expense volume per project is skewed as well: a few projects get most of them.
+    weights = [rng.paretovariate(skew) for _ in range(projects)]
+    ledger = {}
+
+    def expense_rows():
+        for start in range(0, expenses, CHUNK_SIZE):
+            batch = min(CHUNK_SIZE, expenses - start)
+            for offset, project_index in enumerate(rng.choices(range(projects), weights=weights, k=batch)):
+                user_id = rng.choice(members[project_index])
+                cents = rng.randint(100, 20000)
+                key = (project_index + 1, user_id)
+                total, count = ledger.get(key, (0, 0))
+                ledger[key] = (total + cents, count + 1)
+                yield {'description': rng.choice(DESCRIPTIONS), 'amount': cents / 100, 'amount_cents': cents, 'user_id': user_id,
+                       'project_id': project_index + 1, 'created_at': epoch + timedelta(seconds=start + offset)}
+
+    _insert(Expense, expense_rows())
+    log(f'{expenses} expenses')
+
+    for project_id, project_members in enumerate(members, start=1):
+        for user_id in project_members:
+            ledger.setdefault((project_id, user_id), (0, 0))
+    _insert(ProjectBalance, ({'project_id': pid, 'user_id': uid, 'total_paid_cents': total, 'expense_count': count}
+                             for (pid, uid), (total, count) in ledger.items()))
+    log(f'ledger written in {time.perf_counter() - started:.1f}s')
+    log(f'{rollups.backfill()} rollup rows in {time.perf_counter() - started:.1f}s')
+
+    return {'users': users, 'projects': projects, 'participants': len(participant_rows), 'expenses': expenses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic benchmark data.')
+    parser.add_argument('--db', default='sqlite:////tmp/expense_bench.db', help='Target database URI.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--projects', type=int)
+    parser.add_argument('--expenses', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skew', type=float, default=1.2, help='Pareto shape; lower means more skew.')
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    app = bench_app(args.db)
+    with app.app_context():
+        generate(seed=args.seed, skew=args.skew, **scale)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.models import User
+
+PASSWORD = 'correct horse'
+# Project created by alice and shared with bob by the client fixture
+PROJECT_ID = 1
+
+
+def login(client, name):
+    client.post('/login', data={'email': f'{name}@example.com', 'password': PASSWORD})
+    return client
+
+
+def add_expense(client, description, amount, project_id=PROJECT_ID):
+    response = client.post(f'/project/{project_id}', data={'expense-description': description, 'expense-amount': amount})
+    assert response.status_code == 302, response.data
+    return response
+
+
+def client_for(client, name):
+    """
+    Another test client of the same app, logged in as bob, carol, ...
+    """
+    other = client.application.test_client()
+    other.environ_base.update(client.environ_base)
+    return login(other, name)
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    Test client logged in as alice, on a fresh SQLite file with jobs run inline.
+
+    Users alice, bob and carol exist; alice created project 1 and shared it
+    with bob. API writes carry the X-Requested-With header they require.
+    """
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "app.db"}',
+        'SECRET_KEY': 'test',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'CACHE_BACKEND': 'lru',
+        'JOB_WORKERS': 0,
+        'JOB_EXPORT_DIR': str(tmp_path / 'exports'),
+    })
+    with app.app_context():
+        # One hash iteration instead of registering through the form keeps each test fast
+        password = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1')
+        db.session.add_all(User(username=name, email=f'{name}@example.com', password=password)
+                           for name in ('alice', 'bob', 'carol'))
+        db.session.commit()
+    client = app.test_client()
+    client.environ_base['HTTP_X_REQUESTED_WITH'] = 'pytest'
+    login(client, 'alice')
+    client.post('/create_project', data={'name': 'Trip'})
+    client.post(f'/project/{PROJECT_ID}', data={'share-email': 'bob@example.com'})
+    yield client
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,115 @@
+import io
+import pytest
+from sqlalchemy import select
+from app import db
+from app.models import User
+from .conftest import PROJECT_ID, add_expense, client_for
+
+
+def descriptions(payload, key='expenses'):
+    return [expense['description'] for expense in payload[key]]
+
+
+def test_expense_listing_answers_304_until_the_project_changes(client):
+    add_expense(client, 'fuel', '10')
+    url = f'/api/projects/{PROJECT_ID}/expenses'
+    first = client.get(url)
+    assert first.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    add_expense(client_for(client, 'bob'), 'dinner', '20')
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert sorted(descriptions(changed.get_json())) == ['dinner', 'fuel']
+
+
+def test_cached_project_page_shows_new_expenses(client):
+    add_expense(client, 'fuel', '10')
+    assert b'Total Spent: $10.00' in client.get(f'/project/{PROJECT_ID}').data
+    add_expense(client, 'hotel', '2.50')
+    page = client.get(f'/project/{PROJECT_ID}').data
+    assert b'Total Spent: $12.50' in page and b'hotel' in page
+
+
+def test_project_list_follows_membership(client):
+    bob = client_for(client, 'bob')
+    assert [project['id'] for project in bob.get('/api/projects').get_json()] == [PROJECT_ID]
+    with client.application.app_context():
+        bob_id = db.session.scalar(select(User.id).where(User.username == 'bob'))
+    client.post(f'/project/{PROJECT_ID}', data={'remove-user_id': bob_id})
+    assert bob.get('/api/projects').get_json() == []
+    assert bob.get(f'/api/projects/{PROJECT_ID}/expenses').status_code == 403
+
+
+def test_changes_feed_pages_through_an_import_chunk(client):
+    add_expense(client, 'fuel', '10')
+    csv = 'description,amount\n' + ''.join(f'item {i},{i + 1}\n' for i in range(7))
+    client.post(f'/api/projects/{PROJECT_ID}/import?format=csv', data=csv, content_type='text/csv')
+
+    query, seen, pages = 'since=0', [], 0
+    while True:
+        page = client.get(f'/api/projects/{PROJECT_ID}/changes?{query}&limit=3').get_json()
+        seen += descriptions(page)
+        pages += 1
+        since = page['seq']
+        if page['after'] is None:
+            break
+        query = f'since={since}&after={page["after"]}'
+
+    assert pages == 3
+    assert sorted(seen) == sorted(['fuel'] + [f'item {i}' for i in range(7)])
+    assert client.get(f'/api/projects/{PROJECT_ID}/changes?since={since}').get_json()['expenses'] == []
+
+
+def test_changes_feed_reports_settled_expenses_the_client_saw(client):
+    add_expense(client, 'fuel', '10')
+    seen = client.get(f'/api/projects/{PROJECT_ID}/changes?since=0').get_json()
+    client.post(f'/project/{PROJECT_ID}/settle')
+    add_expense(client, 'taxi', '3')
+    changes = client.get(f'/api/projects/{PROJECT_ID}/changes?since={seen["seq"]}').get_json()
+    assert changes['deleted'] == [seen['expenses'][0]['id']]
+    assert descriptions(changes) == ['taxi']
+
+
+@pytest.mark.parametrize('query', ['', 'since=-1', 'since=999', 'since=0&limit=0', 'since=0&after=-1'])
+def test_changes_feed_rejects_bad_arguments(client, query):
+    assert client.get(f'/api/projects/{PROJECT_ID}/changes?{query}').status_code == 400
+
+
+def test_search_filters_open_and_settled_expenses(client):
+    add_expense(client, 'fuel station', '40')
+    client.post(f'/project/{PROJECT_ID}/settle')
+    add_expense(client, 'fuel again', '15')
+    add_expense(client_for(client, 'bob'), 'groceries', '15')
+
+    def search(query):
+        return client.get(f'/api/projects/{PROJECT_ID}/search?{query}').get_json()
+
+    assert descriptions(search('q=fuel'), 'results') == ['fuel again', 'fuel station']
+    assert [hit['settlement_id'] is None for hit in search('q=fuel')['results']] == [True, False]
+    assert descriptions(search('min=10&max=20'), 'results') == ['groceries', 'fuel again']
+    assert descriptions(search('payer=bob'), 'results') == ['groceries']
+    assert descriptions(client.get('/api/search?q=groc').get_json(), 'results') == ['groceries']
+
+
+def test_project_page_search_lists_open_expenses_only(client):
+    add_expense(client, 'fuel old', '9')
+    client.post(f'/project/{PROJECT_ID}/settle')
+    add_expense(client, 'fuel new', '5')
+    page = client.get(f'/project/{PROJECT_ID}?q=fuel').data
+    assert b'fuel new' in page and b'fuel old' not in page
+
+
+@pytest.mark.parametrize('query', ['min=nan', 'max=inf', 'min=1e400', 'min=abc', 'from=2024-13-01', 'after=zz'])
+def test_search_rejects_bad_arguments(client, query):
+    assert client.get(f'/api/projects/{PROJECT_ID}/search?{query}').status_code == 400
+
+
+@pytest.mark.parametrize('path', ['import?format=csv', 'settle', 'recompute', 'export'])
+def test_api_writes_need_the_custom_header(client, path):
+    # What a cross-site <form enctype="text/plain"> can send
+    response = client.post(f'/api/projects/{PROJECT_ID}/{path}', data=io.BytesIO(b'description,amount\nx,1\n'),
+                           content_type='text/plain', headers={'X-Requested-With': ''})
+    assert response.status_code == 403
+    assert client.get(f'/api/projects/{PROJECT_ID}/expenses').get_json()['expenses'] == []
@@ -0,0 +1,62 @@
+import asyncio
+import httpx
+import pytest
+from app.async_api import create_async_app
+from .conftest import PROJECT_ID, add_expense, client_for
+
+
+def call(client, method, url, user=None, **kwargs):
+    """
+    Send one request to the async API, authenticated with the sync client's session cookie.
+    """
+    config = client.application.config
+    api = create_async_app({'SECRET_KEY': config['SECRET_KEY'], 'SQLALCHEMY_DATABASE_URI': config['SQLALCHEMY_DATABASE_URI']})
+    session = (user or client).get_cookie('session')
+    cookies = {'session': session.value} if session else {}
+    headers = {'X-Requested-With': 'pytest', **kwargs.pop('headers', {})}
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url='http://test',
+                                     cookies=cookies, headers=headers) as http:
+            return await http.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize('url', ['/api/projects', '/api/projects?stats=1', f'/api/projects/{PROJECT_ID}/expenses?limit=1'])
+def test_reads_match_the_sync_api(client, url):
+    add_expense(client, 'fuel', '10')
+    add_expense(client, 'hotel', '20')
+    response = call(client, 'GET', url)
+    assert response.status_code == 200
+    assert response.json() == client.get(url).get_json()
+
+
+def test_create_expense(client):
+    response = call(client, 'POST', f'/api/projects/{PROJECT_ID}/expenses', json={'description': 'taxi', 'amount': 12.345})
+    assert response.status_code == 201
+    assert response.json()['amount'] == 12.35
+    assert [expense['description'] for expense in client.get(f'/api/projects/{PROJECT_ID}/expenses').get_json()['expenses']] == ['taxi']
+
+
+@pytest.mark.parametrize('body', [
+    {'description': '', 'amount': 1},
+    {'description': 'x' * 201, 'amount': 1},
+    {'description': 'x', 'amount': 0},
+    {'description': 'x', 'amount': 0.004},  # Rounds to zero cents
+    {'description': 'x', 'amount': 1e300},
+    {'description': 'x', 'amount': 10 ** 400},  # Too large for a float
+    {'description': 'x', 'amount': 'a'},
+    {'description': 'x', 'amount': True},
+    [1],
+])
+def test_create_expense_rejects_bad_bodies(client, body):
+    assert call(client, 'POST', f'/api/projects/{PROJECT_ID}/expenses', json=body).status_code == 400
+
+
+def test_create_expense_needs_access_and_the_custom_header(client):
+    url = f'/api/projects/{PROJECT_ID}/expenses'
+    body = {'description': 'x', 'amount': 1}
+    assert call(client, 'POST', url, json=body, headers={'X-Requested-With': ''}).status_code == 403
+    assert call(client, 'POST', url, user=client_for(client, 'carol'), json=body).status_code == 403
+    assert call(client, 'POST', url, user=client.application.test_client(), json=body).status_code == 401
+    assert call(client, 'GET', '/api/projects/999/expenses').status_code == 404
@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+from sqlalchemy import select
+from app import db, ledger
+from app.models import Expense
+from .conftest import PROJECT_ID
+
+
+def import_rows(client, body, fmt):
+    response = client.post(f'/api/projects/{PROJECT_ID}/import?format={fmt}', data=body,
+                           content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def test_csv_import_books_valid_rows_and_reports_the_rest(client):
+    csv = ('description,amount,payer,created_at\n'
+           'fuel,12.50,,\n'
+           'dinner,30,bob,2024-05-01T20:00:00+02:00\n'
+           ',5,,\n'
+           'taxi,nan,,\n'
+           'hotel,inf,,\n'
+           f'{"x" * 201},1,,\n'
+           'coffee,3,mallory,\n'
+           'museum,4,,yesterday\n')
+    report = import_rows(client, csv, 'csv')
+    assert (report['imported'], report['failed']) == (2, 6)
+    assert [error['line'] for error in report['errors']] == [4, 5, 6, 7, 8, 9]
+
+    with client.application.app_context():
+        rows = dict(db.session.execute(select(Expense.description, Expense.created_at)).all())
+        assert rows['dinner'] == datetime(2024, 5, 1, 18, 0)  # Stored as naive UTC
+        assert sorted(total for total, _ in ledger.get_balances(PROJECT_ID).values()) == [1250, 3000]
+        assert ledger.verify_ledger() == []
+
+
+def test_ndjson_import_in_chunks(client):
+    lines = [json.dumps({'description': f'item {i}', 'amount': i + 1}) for i in range(25)] + ['not json']
+    response = client.post(f'/api/projects/{PROJECT_ID}/import?format=ndjson&chunk_size=10',
+                           data='\n'.join(lines), content_type='application/x-ndjson')
+    report = response.get_json()
+    assert (report['imported'], report['failed']) == (25, 1)
+    with client.application.app_context():
+        assert ledger.get_balances(PROJECT_ID)[1] == (sum(range(1, 26)) * 100, 25)
+
+
+def test_import_needs_a_known_format(client):
+    response = client.post(f'/api/projects/{PROJECT_ID}/import', data='a,b\n', content_type='application/octet-stream')
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import json
+import os
+from sqlalchemy import select, update
+from app import db, ledger
+from app.jobs import export_path
+from app.models import Job, ProjectBalance, Settlement
+from .conftest import PROJECT_ID, add_expense, client_for
+
+
+def run_job(client, kind):
+    response = client.post(f'/api/projects/{PROJECT_ID}/{kind}')
+    assert response.status_code == 202, response.data
+    return client.get(response.headers['Location']).get_json()
+
+
+def test_export_job_writes_open_and_settled_expenses(client):
+    add_expense(client, 'fuel', '10')
+    client.post(f'/project/{PROJECT_ID}/settle')
+    add_expense(client, 'taxi', '3.50')
+
+    job = run_job(client, 'export')
+    assert job['status'] == 'done' and job['progress'] == 1
+    download = client.get(f'/api/jobs/{job["id"]}/download')
+    assert download.status_code == 200
+    rows = [json.loads(line) for line in download.data.decode().splitlines()]
+    assert [(row['description'], row['amount'], row['state']) for row in rows] == [('fuel', 10.0, 'settled'),
+                                                                                   ('taxi', 3.5, 'open')]
+
+
+def test_download_of_a_removed_export_answers_410(client):
+    job = run_job(client, 'export')
+    with client.application.app_context():
+        os.remove(export_path(db.session.get(Job, job['id'])))
+    assert client.get(f'/api/jobs/{job["id"]}/download').status_code == 410
+
+
+def test_recompute_job_fixes_the_ledger(client):
+    add_expense(client, 'fuel', '10')
+    with client.application.app_context():
+        db.session.execute(update(ProjectBalance).values(total_paid_cents=1, expense_count=5))
+        db.session.commit()
+    job = run_job(client, 'recompute')
+    assert job['result']['ledger_rows_fixed'] == 2  # alice's and bob's rows
+    with client.application.app_context():
+        assert ledger.verify_ledger() == []
+
+
+def test_settle_job_is_for_the_creator(client):
+    add_expense(client, 'fuel', '10')
+    assert client_for(client, 'bob').post(f'/api/projects/{PROJECT_ID}/settle').status_code == 403
+    job = run_job(client, 'settle')
+    assert job['result']['expense_count'] == 1
+    with client.application.app_context():
+        assert db.session.scalar(select(Settlement.total_cents)) == 1000
+
+
+def test_another_active_job_answers_409(client):
+    with client.application.app_context():
+        db.session.add(Job(kind='export', project_id=PROJECT_ID, user_id=1, status='running',
+                           active_project_id=PROJECT_ID))
+        db.session.commit()
+    response = client.post(f'/api/projects/{PROJECT_ID}/recompute')
+    assert response.status_code == 409
+    assert response.get_json()['job']['kind'] == 'export'
+    # Repeating the active kind returns the running job
+    assert client.post(f'/api/projects/{PROJECT_ID}/export').get_json()['status'] == 'running'
+
+
+def test_queued_jobs_only_run_when_resumed(client):
+    app = client.application
+    add_expense(client, 'fuel', '10')
+    with app.app_context():
+        db.session.add(Job(kind='settle', project_id=PROJECT_ID, user_id=1, status='queued',
+                           active_project_id=PROJECT_ID))
+        db.session.commit()
+    # Commands build the app too; without JOB_RESUME they leave queued jobs alone
+    assert app.test_cli_runner().invoke(args=['ledger', 'verify']).exit_code == 0
+    with app.app_context():
+        assert db.session.scalar(select(Job.status)) == 'queued'
+
+    result = app.test_cli_runner().invoke(args=['jobs', 'resume'])
+    assert '1 job(s) run' in result.output
+    with app.app_context():
+        assert db.session.scalar(select(Job.status)) == 'done'
+        assert db.session.scalar(select(Settlement.expense_count)) == 1
@@ -0,0 +1,90 @@
+from sqlalchemy import select, update, func
+from app import db, ledger
+from app.models import User, Project, ProjectParticipant, Expense, ArchivedExpense, ProjectBalance, Settlement
+from .conftest import PROJECT_ID, add_expense, client_for
+
+
+def user_ids():
+    return dict(db.session.execute(select(User.username, User.id)).all())
+
+
+def test_expenses_are_booked_in_the_ledger(client):
+    add_expense(client, 'fuel', '10.10')
+    add_expense(client, 'hotel', '5')
+    add_expense(client_for(client, 'bob'), 'dinner', '0.105')  # Rounds half up to 11 cents
+    with client.application.app_context():
+        ids = user_ids()
+        assert ledger.get_balances(PROJECT_ID) == {ids['alice']: (1510, 2), ids['bob']: (11, 1)}
+        assert ledger.verify_ledger() == []
+
+
+def test_rebuild_fixes_drift(client):
+    add_expense(client, 'fuel', '12.34')
+    app = client.application
+    with app.app_context():
+        db.session.execute(update(ProjectBalance).values(total_paid_cents=0, expense_count=0))
+        db.session.commit()
+        assert len(ledger.verify_ledger(PROJECT_ID)) == 1
+
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['ledger', 'verify']).exit_code == 1
+    result = runner.invoke(args=['ledger', 'rebuild'])
+    assert '1 row(s) corrected' in result.output
+    assert runner.invoke(args=['ledger', 'verify']).exit_code == 0
+    with app.app_context():
+        assert ledger.get_balances(PROJECT_ID)[user_ids()['alice']] == (1234, 1)
+
+
+def test_settle_archives_expenses_and_zeroes_the_ledger(client):
+    add_expense(client, 'fuel', '30')
+    add_expense(client_for(client, 'bob'), 'snacks', '10')
+    assert client.post(f'/project/{PROJECT_ID}/settle').status_code == 302
+
+    with client.application.app_context():
+        ids = user_ids()
+        assert db.session.scalar(select(func.count()).select_from(Expense)) == 0
+        assert db.session.scalar(select(func.count()).select_from(ArchivedExpense)) == 2
+        assert all(count == 0 and total == 0 for total, count in ledger.get_balances(PROJECT_ID).values())
+        record = db.session.scalars(select(Settlement)).one()
+        assert (record.total_cents, record.expense_count) == (4000, 2)
+        assert record.transfers == [{'payer_id': ids['bob'], 'receiver_id': ids['alice'], 'amount_cents': 1000}]
+
+    # New expenses after a settlement get fresh IDs and a consistent ledger
+    add_expense(client, 'taxi', '7')
+    with client.application.app_context():
+        assert db.session.scalar(select(func.max(Expense.id))) > 2
+        assert ledger.verify_ledger() == []
+
+
+def test_settle_uses_the_expenses_when_the_ledger_drifted(client):
+    add_expense(client, 'fuel', '20')
+    add_expense(client, 'hotel', '40')
+    with client.application.app_context():
+        # The ledger missed one of alice's expenses
+        db.session.execute(update(ProjectBalance).where(ProjectBalance.user_id == user_ids()['alice'])
+                           .values(total_paid_cents=2000, expense_count=1))
+        db.session.commit()
+    client.post(f'/project/{PROJECT_ID}/settle')
+    with client.application.app_context():
+        record = db.session.scalars(select(Settlement)).one()
+        assert (record.total_cents, record.expense_count) == (6000, 2)
+
+
+def test_settle_without_expenses_keeps_the_version(client):
+    with client.application.app_context():
+        version = db.session.get(Project, PROJECT_ID).version
+    client.post(f'/project/{PROJECT_ID}/settle')
+    with client.application.app_context():
+        assert db.session.get(Project, PROJECT_ID).version == version
+        assert db.session.scalar(select(func.count()).select_from(Settlement)) == 0
+
+
+def test_removing_a_participant_keeps_their_unsettled_balance(client):
+    add_expense(client_for(client, 'bob'), 'dinner', '25')
+    with client.application.app_context():
+        bob_id = user_ids()['bob']
+    client.post(f'/project/{PROJECT_ID}', data={'remove-user_id': bob_id})
+    with client.application.app_context():
+        assert db.session.scalar(select(func.count()).select_from(ProjectParticipant)) == 0
+        assert ledger.get_balances(PROJECT_ID)[bob_id] == (2500, 1)
+        assert ledger.verify_ledger() == []
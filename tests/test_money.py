@@ -0,0 +1,48 @@
+from decimal import Decimal
+import pytest
+from app.money import MAX_CENTS, to_cents, from_cents, format_cents, valid_amount
+
+
+@pytest.mark.parametrize('amount, cents', [
+    (0, 0),
+    (12, 1200),
+    (0.1 + 0.2, 30),
+    (1.005, 101),  # Half up on the decimal string, not the binary float
+    (2.675, 268),
+    (0.004, 0),
+    (0.005, 1),
+    (-0.005, -1),  # Half away from zero
+    (-1.005, -101),
+    ('19.99', 1999),
+    (Decimal('7.125'), 713),
+    (1e12, 10 ** 14),
+])
+def test_to_cents_rounds_half_up(amount, cents):
+    assert to_cents(amount) == cents
+
+
+@pytest.mark.parametrize('cents', [0, 1, 99, 1999, -250, 10 ** 12])
+def test_to_cents_round_trips_from_cents(cents):
+    assert to_cents(from_cents(cents)) == cents
+
+
+@pytest.mark.parametrize('cents, text', [(0, '0.00'), (5, '0.05'), (1234, '12.34'), (-1234, '-12.34'), (-5, '-0.05')])
+def test_format_cents(cents, text):
+    assert format_cents(cents) == text
+
+
+@pytest.mark.parametrize('amount, valid', [
+    (1.5, True),
+    (-1.5, True),
+    (MAX_CENTS / 100, True),
+    (MAX_CENTS / 100 * 2, False),
+    (float('nan'), False),
+    (float('inf'), False),
+    (float('-inf'), False),
+    (MAX_CENTS // 100, True),
+    (MAX_CENTS // 100 + 1, False),
+    (10 ** 400, False),  # Too large for a float
+    (-10 ** 400, False),
+])
+def test_valid_amount(amount, valid):
+    assert valid_amount(amount) is valid
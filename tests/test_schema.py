@@ -0,0 +1,71 @@
+import sqlite3
+from sqlalchemy import select, func
+from app import create_app, db, ledger
+from app.models import Expense, ArchivedExpense, ProjectBalance, DailySpend, MonthlySpend, SchemaVersion
+from app.schema import SCHEMA_VERSION
+from .conftest import PROJECT_ID, add_expense, client_for, login
+
+
+def reopen(client, **config):
+    """
+    Build a new app on the client's database, as a restarted worker would.
+    """
+    app = create_app({**client.application.config, **config})
+    other = app.test_client()
+    other.environ_base.update(client.environ_base)
+    return login(other, 'alice')
+
+
+def database_path(client):
+    return client.application.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///')
+
+
+def test_unversioned_database_is_upgraded(client):
+    add_expense(client, 'fuel', '10')
+    add_expense(client_for(client, 'bob'), 'dinner', '5.50')
+    with client.application.app_context():
+        db.engine.dispose()
+
+    # Turn the file into one from before schema versioning: no version, no
+    # ledger or rollups, and an expense table without AUTOINCREMENT.
+    conn = sqlite3.connect(database_path(client), isolation_level=None)
+    conn.execute('PRAGMA foreign_keys=OFF')
+    for table in (SchemaVersion, ProjectBalance, DailySpend, MonthlySpend):
+        conn.execute(f'DELETE FROM {table.__tablename__}')
+    ddl = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'expense'").fetchone()[0]
+    conn.execute('ALTER TABLE expense RENAME TO expense_old')
+    conn.execute(ddl.replace(' AUTOINCREMENT', ''))
+    conn.execute('INSERT INTO expense SELECT * FROM expense_old')
+    conn.execute('DROP TABLE expense_old')
+    conn.close()
+
+    upgraded = reopen(client, BOOT_MODE='development')
+    app = upgraded.application
+    with app.app_context():
+        assert db.session.scalar(select(SchemaVersion.version)) == SCHEMA_VERSION
+        assert sorted(total for total, _ in ledger.get_balances(PROJECT_ID).values()) == [550, 1000]
+        assert db.session.scalar(select(func.sum(MonthlySpend.paid_cents))) == 1550
+        ddl = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE name = 'expense'")).scalar()
+        assert 'AUTOINCREMENT' in ddl
+
+    assert b'Total Spent: $15.50' in upgraded.get(f'/project/{PROJECT_ID}').data
+    upgraded.post(f'/project/{PROJECT_ID}/settle')
+    add_expense(upgraded, 'taxi', '3')  # Must not reuse an archived expense's ID
+    with app.app_context():
+        assert db.session.scalar(select(func.min(Expense.id))) > db.session.scalar(select(func.max(ArchivedExpense.id)))
+        assert ledger.verify_ledger() == []
+        db.engine.dispose()
+
+
+def test_production_boot_waits_for_the_migration(client):
+    with client.application.app_context():
+        db.session.get(SchemaVersion, 1).version = SCHEMA_VERSION - 1
+        db.session.commit()
+
+    production = reopen(client, BOOT_MODE='production')
+    assert production.get('/').status_code == 503
+    result = production.application.test_cli_runner().invoke(args=['schema', 'migrate'])
+    assert result.exit_code == 0, result.output
+    assert login(production, 'alice').get('/').status_code == 200  # Logging in was refused with the rest
+    with production.application.app_context():
+        db.engine.dispose()
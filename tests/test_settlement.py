@@ -0,0 +1,114 @@
+import random
+import numpy as np
+import pytest
+from app.settlement import EXACT_MAX_PARTIES, settle, net_balances, split_evenly, split_evenly_array, _zero_sum_groups
+
+
+def apply(balances, transfers):
+    remaining = dict(balances)
+    for transfer in transfers:
+        assert transfer.amount_cents > 0
+        remaining[transfer.payer] -= transfer.amount_cents
+        remaining[transfer.receiver] += transfer.amount_cents
+    return remaining
+
+
+def max_zero_sum_groups(amounts):
+    # Brute force over the groups containing the first amount
+    if not amounts:
+        return 0
+    first, rest = amounts[0], amounts[1:]
+    best = 0
+    for mask in range(1 << len(rest)):
+        group = [amount for i, amount in enumerate(rest) if mask >> i & 1]
+        if first + sum(group) == 0:
+            others = [amount for i, amount in enumerate(rest) if not mask >> i & 1]
+            best = max(best, 1 + max_zero_sum_groups(others))
+    return best
+
+
+def random_balances(rng, n):
+    amounts = [rng.randint(-5000, 5000) for _ in range(n - 1)]
+    return {f'u{i}': amount for i, amount in enumerate(amounts + [-sum(amounts)])}
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('seed', range(20))
+def test_transfers_zero_the_balances(seed, exact):
+    rng = random.Random(seed)
+    balances = random_balances(rng, rng.randint(1, 12))
+    transfers = settle(balances, exact=exact)
+    assert all(value == 0 for value in apply(balances, transfers).values())
+    assert len(transfers) <= max(len([v for v in balances.values() if v]) - 1, 0)
+
+
+def test_greedy_mode_above_exact_limit_zeroes_the_balances():
+    balances = random_balances(random.Random(1), EXACT_MAX_PARTIES + 10)
+    assert all(value == 0 for value in apply(balances, settle(balances, exact=True)).values())
+
+
+@pytest.mark.parametrize('balances, expected', [
+    ({'a': 4, 'b': 3, 'c': 2, 'd': -5, 'e': -4}, 3),  # Greedy needs 4
+    ({'a': 5, 'b': -5, 'c': 3, 'd': -3}, 2),
+    ({'a': 10, 'b': 10, 'c': -7, 'd': -3, 'e': -10}, 3),
+    ({'a': 1, 'b': 1, 'c': 1, 'd': -1, 'e': -1, 'f': -1}, 3),
+    ({'a': 6, 'b': 4, 'c': -5, 'd': -5}, 3),
+    ({'a': 0, 'b': 0}, 0),
+])
+def test_exact_mode_is_minimal_on_known_cases(balances, expected):
+    transfers = settle(balances, exact=True)
+    assert len(transfers) == expected
+    assert all(value == 0 for value in apply(balances, transfers).values())
+
+
+def test_exact_mode_beats_greedy():
+    balances = {'a': 4, 'b': 3, 'c': 2, 'd': -5, 'e': -4}
+    assert len(settle(balances, exact=True)) < len(settle(balances))
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_zero_sum_groups_is_maximal(seed):
+    rng = random.Random(seed)
+    amounts = [rng.choice([-3, -2, -1, 1, 2, 3]) for _ in range(rng.randint(1, 8))]
+    amounts.append(-sum(amounts))
+    amounts = [amount for amount in amounts if amount]
+    groups = _zero_sum_groups(amounts)
+    assert sorted(i for group in groups for i in group) == list(range(len(amounts)))
+    assert all(sum(amounts[i] for i in group) == 0 for group in groups)
+    assert len(groups) == max_zero_sum_groups(amounts)
+
+
+def test_unbalanced_input_is_rejected():
+    with pytest.raises(ValueError):
+        settle({'a': 1, 'b': -2})
+
+
+def test_net_balances_sum_to_zero_and_pay_back_non_members():
+    balances = net_balances({'a': 1000, 'b': 1, 'gone': 500}, ['a', 'b', 'c'])
+    assert sum(balances.values()) == 0
+    assert balances['gone'] == -500
+    assert balances == {'a': -499, 'b': 499, 'c': 500, 'gone': -500}  # The remainder cent goes to the first member
+
+
+@pytest.mark.parametrize('total, n', [(100, 3), (1, 4), (0, 2), (-101, 3), (999999, 7)])
+def test_split_evenly_sums_to_total(total, n):
+    shares = split_evenly(total, n)
+    assert sum(shares) == total
+    assert max(shares) - min(shares) <= 1
+
+
+def test_split_evenly_array_sums_exactly_and_matches_split_evenly():
+    rng = np.random.default_rng(0)
+    totals = rng.integers(-10 ** 9, 10 ** 9, size=50)
+    mask = np.array([True, False, True, True, False, True, True])
+    shares = split_evenly_array(totals, mask)
+    assert shares.shape == (len(mask), len(totals))
+    assert (shares.sum(axis=0) == totals).all()
+    assert (shares[~mask] == 0).all()
+    for column, total in enumerate(totals):
+        assert shares[mask, column].tolist() == split_evenly(int(total), int(mask.sum()))
+
+
+def test_split_evenly_array_without_members():
+    shares = split_evenly_array(np.array([100, 5]), np.array([False, False]))
+    assert shares.tolist() == [[0, 0], [0, 0]]